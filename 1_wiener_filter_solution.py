@@ -18,7 +18,7 @@
 import numpy as np
 
 import nifty5 as ift
-from helpers import generate_wf_data, plot_WF
+from helpers import WienerFilter, generate_wf_data, plot_WF
 
 np.random.seed(42)
 
@@ -54,9 +54,14 @@ m = D(j)
 
 plot_WF('result', ground_truth, data, m)
 
-S = ift.SandwichOperator.make(HT.adjoint, S_h)
-D = ift.WienerFilterCurvature(R, N, S, IC, IC).inverse
+# R removes only the geometry and N is scalar, so D is diagonal in the
+# harmonic basis and can be applied without CG
+wf = WienerFilter(R, N, HT, S_h, tol=1e-7, iteration_limit=100)
+m_fast = wf.mean(data)
+print('Spectral solve: {}, max. deviation from CG: {:.2e}'.format(
+    wf.fast, np.max(np.abs((m_fast - m).to_global_data()))))
+
 N_samples = 10
-samples = [D.draw_sample() + m for i in range(N_samples)]
+samples = wf.draw_samples(N_samples) + m.to_global_data()
 
 plot_WF('result', ground_truth, data, m=m, samples=samples)
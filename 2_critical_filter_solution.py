@@ -18,39 +18,70 @@
 import numpy as np
 
 import nifty5 as ift
-from helpers import (checkerboard_response, generate_gaussian_data,
-                     plot_prior_samples_2d, plot_reconstruction_2d)
+from helpers import (AdaptiveKLSchedule, KLCheckpoint,
+                     ParallelMetricGaussianKL, PosteriorResult, ResultCache,
+                     SampleWorkers, SamplingHamiltonian, TelemetryStream,
+                     cached_power_space, checkerboard_response,
+                     checkerboard_slab_response, generate_gaussian_data,
+                     is_distributed, ntask, plot_prior_samples_2d,
+                     plot_reconstruction_2d, rank_seed, summarize_samples)
 
-np.random.seed(42)
+seed = 42
+# with MPI, every task draws its own slab of the random fields
+np.random.seed(rank_seed(seed))
 
 position_space = ift.RGSpace(2*(256,))
 harmonic_space = position_space.get_default_codomain()
 HT = ift.HarmonicTransformOperator(harmonic_space, target=position_space)
-power_space = ift.PowerSpace(harmonic_space)
+power_space = cached_power_space(harmonic_space)
 
 # Set up generative model
-A = ift.SLAmplitude(
-    **{
-        'target': power_space,
-        'n_pix': 64,  # 64 spectral bins
-        # Smoothness of spectrum
-        'a': 10,  # relatively high variance of spectral curvature
-        'k0': .2,  # quefrency mode below which cepstrum flattens
-        # Power-law part of spectrum
-        'sm': -4,  # preferred power-law slope
-        'sv': .6,  # low variance of power-law slope
-        'im': -2,  # y-intercept mean, in-/decrease for more/less contrast
-        'iv': 2.  # y-intercept variance
-    })
+amplitude = {
+    'n_pix': 64,  # 64 spectral bins
+    # Smoothness of spectrum
+    'a': 10,  # relatively high variance of spectral curvature
+    'k0': .2,  # quefrency mode below which cepstrum flattens
+    # Power-law part of spectrum
+    'sm': -4,  # preferred power-law slope
+    'sv': .6,  # low variance of power-law slope
+    'im': -2,  # y-intercept mean, in-/decrease for more/less contrast
+    'iv': 2.  # y-intercept variance
+}
+A = ift.SLAmplitude(target=power_space, **amplitude)
 signal = ift.CorrelatedField(position_space, A)
-R = checkerboard_response(position_space)
+# With `mpirun -np <n>`, the mask acts on the local slab only
+response = checkerboard_slab_response if is_distributed() \
+    else checkerboard_response
+R = response(position_space)
 
 data_space = R.target
 signal_response = R @ signal
 
+# Results of every stage are cached under a hash of its configuration, so
+# that only the stages after a changed setting are recomputed
+results = ResultCache('criticalfilter')
+
 # Set up likelihood and generate data from the model
-N = ift.ScalingOperator(0.1, data_space)
-data, ground_truth = generate_gaussian_data(signal_response, N)
+noise = 0.1
+N = ift.ScalingOperator(noise, data_space)
+# the random fields are drawn slab by slab, so the data depend on ntask
+data_key = results.key('data', position_space, amplitude, response, noise,
+                       seed, ntask())
+
+
+def generate():
+    data, ground_truth = generate_gaussian_data(signal_response, N)
+    if is_distributed():
+        # no data (and no noise) at the masked pixels
+        data = R(R.adjoint(data))
+    return {'data': data, 'ground_truth': ground_truth}
+
+
+res = results.cached(data_key, generate, {
+    'data': data_space,
+    'ground_truth': signal_response.domain
+})
+data, ground_truth = res['data'], res['ground_truth']
 
 plot_prior_samples_2d(5, signal, R, signal, A, 'gauss', N=N)
 
@@ -58,22 +89,62 @@ likelihood = ift.GaussianEnergy(
     mean=data, inverse_covariance=N.inverse)(signal_response)
 
 # Solve inference problem
-ic_sampling = ift.GradientNormController(iteration_limit=100)
-ic_newton = ift.GradInfNormController(
-    name='Newton', tol=1e-6, iteration_limit=30)
+sampling_settings = {'iteration_limit': 100}
+newton_settings = {'name': 'Newton', 'tol': 1e-6, 'iteration_limit': 30}
+n_iterations, n_samples, N_posterior_samples = 10, (2, 5), 30
+telemetry = TelemetryStream.from_environment('criticalfilter')
+ic_sampling = ift.GradientNormController(**sampling_settings)
+ic_newton = telemetry.watch(ift.GradInfNormController(**newton_settings))
 minimizer = ift.NewtonCG(ic_newton)
-H = ift.StandardHamiltonian(likelihood, ic_sampling)
+H = SamplingHamiltonian(likelihood, ic_sampling)
+workers = SampleWorkers(H, seed=seed)
+telemetry.count_workers(workers)
+kl_key = results.key('kl', data_key, sampling_settings, newton_settings,
+                     n_iterations, n_samples, seed)
+
+# Draw up to five samples and minimize KL, iterate up to 10 times. The
+# checkpoint belongs to this configuration of the stage and is removed once
+# its result is cached.
+schedule = AdaptiveKLSchedule(n_iterations, n_samples)
+checkpoint = KLCheckpoint(kl_key, workers, schedule=schedule,
+                          config=(kl_key,))
+
 
-initial_mean = ift.MultiField.full(H.domain, 0.)
-mean = initial_mean
+def minimize():
+    initial_mean = ift.MultiField.full(H.domain, 0.)
+    mean, first = checkpoint.resume(initial_mean, n_iterations)
 
-# Draw five samples and minimize KL, iterate 10 times
-for _ in range(10):
-    KL = ift.MetricGaussianKL(mean, H, 5)
-    KL, convergence = minimizer(KL)
-    mean = KL.position
+    for i in schedule.iterations(first):
+        KL = ParallelMetricGaussianKL(mean, workers, schedule.n_samples)
+        telemetry.outer = i
+        KL_new, convergence = minimizer(KL)
+        schedule.update(KL, KL_new)
+        mean = KL_new.position
+        checkpoint.save(i + 1, mean)
+    return {'position': mean, 'report': schedule.report()}
+
+
+res = results.cached(kl_key, minimize, {'position': H.domain})
+checkpoint.clear()
+mean = res['position']
+print(res['report'])
 
 # Draw posterior samples and plot
-N_posterior_samples = 30
-KL = ift.MetricGaussianKL(mean, H, N_posterior_samples)
+posterior_key = results.key('posterior', kl_key, N_posterior_samples)
+
+
+def sample():
+    KL = ParallelMetricGaussianKL(mean, workers, N_posterior_samples)
+    sc = summarize_samples((signal(KL.position + s) for s in KL.samples),
+                           quantiles=None)
+    return {'samples': KL.samples, 'mean': sc.mean, 'var': sc.var}
+
+
+res = results.cached(posterior_key, sample, {
+    'samples': H.domain,
+    'mean': position_space,
+    'var': position_space
+})
+KL = PosteriorResult(mean, res['samples'])
 plot_reconstruction_2d(data, ground_truth, KL, signal, R, A, 'criticalfilter')
+workers.close()
@@ -15,69 +15,31 @@
 #
 # NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
 
-import numpy as np
-
 import helpers as h
 import nifty5 as ift
 
-seeds = [123, 42]
-name = ['bernoulli', 'poisson']
-for mode in [0, 1]:
-    np.random.seed(seeds[mode])
-
-    position_space = ift.RGSpace([256, 256])
-    harmonic_space = position_space.get_default_codomain()
-    power_space = ift.PowerSpace(harmonic_space)
-    HT = ift.HarmonicTransformOperator(harmonic_space, target=position_space)
-
-    # Set up an amplitude operator for the field
-    dct = {
-        'target': power_space,
-        'n_pix': 64,  # 64 spectral bins
-        # Spectral smoothness (affects Gaussian process part)
-        'a': 10,  # relatively high variance of spectral curvature
-        'k0': .2,  # quefrency mode below which cepstrum flattens
-        # Power-law part of spectrum:
-        'sm': -4,  # preferred power-law slope
-        'sv': .6,  # low variance of power-law slope
-        'im': -3,  # y-intercept mean, in-/decrease for more/less contrast
-        'iv': 2.  # y-intercept variance
-    }
-    A = ift.SLAmplitude(**dct)
-    correlated_field = ift.CorrelatedField(position_space, A)
-
-    dct = {}
-    if mode == 0:
-        signal = correlated_field.sigmoid()
-        R = h.checkerboard_response(position_space)
-    else:
-        signal = correlated_field.exp()
-        R = h.exposure_response(position_space)
-    h.plot_prior_samples_2d(5, signal, R, correlated_field, A, name[mode],
-                            **dct)
-    signal_response = R @ signal
-    if mode == 0:
-        signal_response = signal_response.clip(1e-5, 1 - 1e-5)
-        data, ground_truth = h.generate_bernoulli_data(signal_response)
-        likelihood = ift.BernoulliEnergy(data) @ signal_response
-    else:
-        data, ground_truth = h.generate_poisson_data(signal_response)
-        likelihood = ift.PoissonianEnergy(data) @ signal_response
+# Amplitude parameters, in addition to h.DEFAULT_AMPLITUDE
+amplitude = {
+    'n_pix': 64,  # 64 spectral bins
+    # Spectral smoothness (affects Gaussian process part)
+    'a': 10,  # relatively high variance of spectral curvature
+    'k0': .2,  # quefrency mode below which cepstrum flattens
+    # Power-law part of spectrum:
+    'sm': -4,  # preferred power-law slope
+    'sv': .6,  # low variance of power-law slope
+    'im': -3,  # y-intercept mean, in-/decrease for more/less contrast
+    'iv': 2.  # y-intercept variance
+}
+scenarios = [
+    h.Scenario('bernoulli', 'bernoulli', h.checkerboard_response, seed=123,
+               amplitude=amplitude),
+    h.Scenario('poisson', 'poisson', h.exposure_response, seed=42,
+               amplitude=amplitude),
+]
 
-    # Solve inference problem
-    ic_sampling = ift.GradientNormController(iteration_limit=100)
-    ic_newton = ift.GradInfNormController(
-        name='Newton', tol=1e-6, iteration_limit=50)
-    minimizer = ift.NewtonCG(ic_newton)
-    H = ift.StandardHamiltonian(likelihood, ic_sampling)
-    initial_mean = ift.MultiField.full(H.domain, 0.)
-    mean = initial_mean
-    N_samples = 5
-    for _ in range(5):
-        # Draw new samples and minimize KL
-        KL = ift.MetricGaussianKL(mean, H, N_samples)
-        KL, convergence = minimizer(KL)
-        mean = KL.position
-    N_posterior_samples = 30
-    KL = ift.MetricGaussianKL(mean, H, N_posterior_samples)
-    h.plot_reconstruction_2d(data, ground_truth, KL, signal, R, A, name[mode])
+# Both scenarios share the geometry and the correlated field and run
+# concurrently, each on its share of the cores (NIFTY_TUTORIAL_SWEEP_CORES)
+sweep = h.ScenarioSweep(ift.RGSpace([256, 256]), scenarios)
+for result in sweep.run():
+    print(result['name'])
+    print(result['report'])
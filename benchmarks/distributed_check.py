@@ -0,0 +1,127 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Checks the slab-distributed correlated field inference against a single
+# process. Run it once without MPI, which writes the reference, and then on
+# several processes of the same machine:
+#
+#   python3 benchmarks/distributed_check.py [size]
+#   mpirun -np 4 python3 benchmarks/distributed_check.py [size]
+#
+# Ground truth and noise are drawn globally with the same seed in every
+# task and scattered, so both runs see the same data. Compared are the
+# signal response, the adjoint of the response and the MAP estimate after a
+# few Newton steps; the KL minimization, whose samples depend on the number
+# of tasks, is only timed. The exit status is 1 if a relative deviation
+# exceeds the tolerance.
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+rtol = 1e-5
+n_iterations, n_samples = 2, 4
+reference = os.path.join(os.path.dirname(__file__),
+                         'distributed_reference_{}.npz'.format(size))
+
+
+def report(*args):
+    if h.is_master():
+        print(*args)
+
+
+position_space = ift.RGSpace(2*(size,))
+power_space = h.cached_power_space(position_space.get_default_codomain())
+A = ift.SLAmplitude(target=power_space, **h.DEFAULT_AMPLITUDE)
+signal = ift.CorrelatedField(position_space, A).sigmoid()
+R = h.checkerboard_slab_response(position_space)
+N = ift.ScalingOperator(0.1, R.target)
+signal_response = R @ signal
+
+# global draws, identical in every task
+np.random.seed(42)
+xi = ift.MultiField.from_global_data(
+    signal_response.domain,
+    {k: np.random.normal(size=d.shape)
+     for k, d in signal_response.domain.items()})
+noise = np.random.normal(size=R.target.shape)*np.sqrt(0.1)
+observed = h.tiled_mask(position_space.shape) == 0
+data = signal_response(xi) + ift.from_global_data(R.target,
+                                                  noise*observed)
+
+t0 = time()
+res = {
+    'response': signal_response(xi).to_global_data(),
+    'adjoint': R.adjoint(data).to_global_data()
+}
+t_model = time() - t0
+
+likelihood = ift.GaussianEnergy(
+    mean=data, inverse_covariance=N.inverse)(signal_response)
+H = ift.StandardHamiltonian(likelihood)
+minimizer = ift.NewtonCG(
+    ift.GradInfNormController(name='Newton', iteration_limit=5))
+t0 = time()
+E = ift.EnergyAdapter(ift.MultiField.full(H.domain, 0.), H,
+                      want_metric=True)
+E, _ = minimizer(E)
+t_map = time() - t0
+for k, v in E.position.to_global_data().items():
+    res['map:' + k] = v
+
+H = ift.StandardHamiltonian(
+    likelihood, ift.GradientNormController(iteration_limit=100))
+minimizer = ift.NewtonCG(
+    ift.GradInfNormController(name='Newton', iteration_limit=5))
+mean = E.position
+t0 = time()
+with h.SampleWorkers(H, seed=42) as workers:
+    for _ in range(n_iterations):
+        KL = h.ParallelMetricGaussianKL(mean, workers, n_samples)
+        KL, _ = minimizer(KL)
+        mean = KL.position
+t_kl = time() - t0
+
+report('{} task(s), {}x{} pixels'.format(h.ntask(), size, size))
+report('model and adjoint: {:8.3f} s'.format(t_model))
+report('MAP:               {:8.3f} s'.format(t_map))
+report('KL:                {:8.3f} s (final KL {:.6e})'.format(
+    t_kl, KL.value))
+
+failed = False
+if not h.is_distributed():
+    np.savez(reference, **res)
+    report('reference written to', reference)
+elif not os.path.exists(reference):
+    report('no reference, run without MPI first')
+    failed = True
+else:
+    with np.load(reference) as f:
+        for key, val in res.items():
+            ref = f[key]
+            dev = np.linalg.norm(val - ref)/np.linalg.norm(ref)
+            report('relative deviation of {:20s} {:.2e}'.format(key, dev))
+            failed = failed or not dev < rtol
+sys.exit(1 if failed else 0)
@@ -0,0 +1,71 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Thread scaling of the harmonic transforms on 2D grids: best wall time of
+# HarmonicTransformOperator and HartleyOperator (forward and adjoint) for 1,
+# 2, 4, ... up to all available threads, and the speedup over one thread.
+#
+# Usage: python3 benchmarks/fft_threads.py [size ...]
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+sizes = [int(s) for s in sys.argv[1:]] or [256, 512, 1024, 2048]
+max_threads = len(os.sched_getaffinity(0)) if hasattr(
+    os, 'sched_getaffinity') else os.cpu_count()
+threads = sorted(set([2**i for i in range(max_threads.bit_length())] +
+                     [max_threads]))
+repeat = 5
+
+
+def best_time(f, x):
+    f(x)
+    res = np.inf
+    for _ in range(repeat):
+        t0 = time()
+        f(x)
+        res = min(res, time() - t0)
+    return res
+
+
+for size in sizes:
+    position_space = ift.RGSpace(2*(size,))
+    harmonic_space = position_space.get_default_codomain()
+    ops = {
+        'HarmonicTransformOperator':
+        ift.HarmonicTransformOperator(harmonic_space, target=position_space),
+        'HartleyOperator':
+        ift.HartleyOperator(harmonic_space, target=position_space)
+    }
+    for name, op in ops.items():
+        x = ift.from_random('normal', op.domain)
+        y = ift.from_random('normal', op.target)
+        base = None
+        for n in threads:
+            h.set_fft_threads(n)
+            t = best_time(op, x) + best_time(op.adjoint, y)
+            base = t if base is None else base
+            print('{:5d}^2 {:26s} {:3d} threads {:9.4f} s  speedup {:5.2f}'
+                  .format(size, name, n, t, base/t))
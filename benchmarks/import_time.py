@@ -0,0 +1,68 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Start-up cost of the helpers package: best wall time of a fresh
+# interpreter which imports helpers and uses the names of one group, and
+# whether matplotlib got imported. The exit status is 1 if a compute-only
+# group imports matplotlib or takes longer than the limit.
+#
+# Usage: python3 benchmarks/import_time.py [limit_ms] [repeat]
+
+import os
+import subprocess
+import sys
+
+limit = float(sys.argv[1]) if len(sys.argv) > 1 else None
+repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# group: (names used, compute-only)
+groups = {
+    'nifty5 only': ('', True),
+    'package': ('', True),
+    'generate_data': ('h.generate_gaussian_data', True),
+    'responses': ('h.checkerboard_response', True),
+    'parallel KL': ('h.SampleWorkers, h.ParallelMetricGaussianKL', True),
+    'plot': ('h.plot_reconstruction_2d', False),
+}
+
+code = '''
+import sys
+from time import time
+t0 = time()
+{imp}
+{names}
+print(time() - t0, 'matplotlib' in sys.modules)
+'''
+
+failed = False
+for name, (names, compute_only) in groups.items():
+    imp = 'import nifty5' if name == 'nifty5 only' else 'import helpers as h'
+    best, mpl = None, None
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', code.format(imp=imp, names=names)],
+            cwd=root, env=dict(os.environ, NIFTY_TUTORIAL_HEADLESS='0'))
+        dt, mpl = out.split()[-2:]
+        dt = float(dt)
+        best = dt if best is None else min(best, dt)
+    bad = compute_only and (mpl == b'True' or
+                            (limit is not None and best*1e3 > limit))
+    failed = failed or bad
+    print('{:16s} {:8.1f} ms  matplotlib: {:5s} {}'.format(
+        name, best*1e3, mpl.decode(), 'FAIL' if bad else ''))
+sys.exit(1 if failed else 0)
@@ -0,0 +1,106 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Wall-clock time until the KL of the critical filter problem of
+# 2_critical_filter_solution.py reaches a gradient tolerance, starting cold
+# from zero and warm from the multigrid driver.
+#
+# Usage: python3 benchmarks/multigrid_warm_start.py [size] [tol]
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+tol = float(sys.argv[2]) if len(sys.argv) > 2 else 1e-3
+noise = 0.1
+
+np.random.seed(42)
+position_space = ift.RGSpace(2*(size,))
+
+
+def amplitude(space):
+    power_space = ift.PowerSpace(space.get_default_codomain())
+    return ift.SLAmplitude(target=power_space, n_pix=64, a=10, k0=.2, sm=-4,
+                           sv=.6, im=-2, iv=2.)
+
+
+A = amplitude(position_space)
+signal = ift.CorrelatedField(position_space, A)
+R = h.checkerboard_response(position_space)
+N = ift.ScalingOperator(noise, R.target)
+data, ground_truth = h.generate_gaussian_data(R @ signal, N)
+image = R.adjoint(data).to_global_data()
+counts = R.adjoint(ift.full(R.target, 1.)).to_global_data()
+
+
+def build(space, factor):
+    cf = ift.CorrelatedField(space, amplitude(space))
+    if factor == 1:
+        resp, d, n = R, data, N
+    else:
+        # Average the data over the observed fine pixels of each coarse one
+        cnt = h.block_sum(counts, factor)
+        resp = h.MaskedExposureResponse(space, flags=cnt == 0)
+        obs = cnt[cnt > 0]
+        d = ift.from_global_data(resp.target,
+                                 h.block_sum(image, factor)[cnt > 0]/obs)
+        n = ift.makeOp(ift.from_global_data(resp.target, noise/obs))
+    lh = ift.GaussianEnergy(mean=d, inverse_covariance=n.inverse)(resp @ cf)
+    ic_sampling = ift.GradientNormController(iteration_limit=100)
+    return ift.StandardHamiltonian(lh, ic_sampling), cf
+
+
+def inf_norm(field):
+    return max(np.max(np.abs(v)) for v in field.to_global_data().values())
+
+
+def time_to_tolerance(H, mean, max_iterations=20):
+    minimizer = ift.NewtonCG(
+        ift.GradInfNormController(name='Newton', tol=1e-6, iteration_limit=30))
+    t0 = time()
+    with h.SampleWorkers(H, seed=42) as workers:
+        for i in range(max_iterations):
+            KL = h.ParallelMetricGaussianKL(mean, workers, 5)
+            if inf_norm(KL.gradient) < tol:
+                break
+            KL, _ = minimizer(KL)
+            mean = KL.position
+    return time() - t0, i
+
+
+H, cf = build(position_space, 1)
+t_cold, it_cold = time_to_tolerance(H, ift.MultiField.full(H.domain, 0.))
+
+t0 = time()
+H, cf, initial_mean = h.multigrid_initial_mean(
+    build, position_space, factors=(8, 4, 2))
+t_coarse = time() - t0
+t_warm, it_warm = time_to_tolerance(H, initial_mean)
+
+print('grid {0}x{0}, gradient tolerance {1:g}'.format(size, tol))
+print('cold start: {:8.1f} s ({} outer iterations)'.format(t_cold, it_cold))
+print('warm start: {:8.1f} s ({} outer iterations) + {:.1f} s coarse levels'
+      .format(t_warm, it_warm, t_coarse))
+print('total speed-up: {:.2f}'.format(t_cold/(t_warm + t_coarse)))
@@ -0,0 +1,287 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Scaling benchmark of the stages of the tutorial pipelines.
+#
+# Every stage of every pipeline is timed on its own in a forked process, for
+# each grid size and sample count; the stages it depends on are run untimed
+# before. Wall time and the increase of the peak RSS of the process during
+# the stage (on Linux; elsewhere, by how much the stage raised the peak of
+# the whole process) are written as JSON and can be compared against a
+# stored baseline:
+#
+#   python3 benchmarks/pipelines.py --sizes 64 128 256 --output base.json
+#   python3 benchmarks/pipelines.py --baseline base.json --output new.json
+#
+# The exit status is 1 if a stage got slower (or larger) than the baseline
+# by more than the given threshold.
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import traceback
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+STAGES = ['operators', 'data', 'kl', 'newton', 'plot']
+SAMPLE_STAGES = ['kl', 'newton', 'plot']
+
+
+def _amplitude(power_space, im):
+    return ift.SLAmplitude(target=power_space, n_pix=64, a=10, k0=.2, sm=-4,
+                           sv=.6, im=im, iv=2.)
+
+
+class WienerFilterPipeline(object):
+    '''1_wiener_filter_solution.py on RGSpace(size). Its 'kl' stage is the
+    posterior mean, its 'newton' stage the posterior sampling.'''
+
+    def operators(self, c):
+        c['space'] = ift.RGSpace(c['size'])
+        c['R'] = ift.GeometryRemover(c['space'])
+        c['N'] = ift.ScalingOperator(0.1, c['R'].target)
+        harmonic_space = c['space'].get_default_codomain()
+        c['HT'] = ift.HartleyOperator(harmonic_space, target=c['space'])
+        c['S_h'] = ift.create_power_operator(harmonic_space,
+                                             lambda k: 1/(10. + k**2.5))
+
+    def data(self, c):
+        d, s = h.generate_wf_data(c['space'], lambda k: 1/(10. + k**2.5))
+        c['data'] = ift.from_global_data(c['R'].target, d)
+        c['ground_truth'] = ift.from_global_data(c['space'], s)
+
+    def kl(self, c):
+        c['wf'] = h.WienerFilter(c['R'], c['N'], c['HT'], c['S_h'])
+        c['m'] = c['wf'].mean(c['data'])
+
+    def newton(self, c):
+        c['samples'] = c['wf'].draw_samples(c['n_samples'])
+
+    def plot(self, c):
+        h.plot_WF('bench', c['ground_truth'], c['data'], c['m'],
+                  c['samples'] + c['m'].to_global_data())
+
+
+class CriticalFilterPipeline(object):
+    '''2_critical_filter_solution.py (mode None) and the scenarios of
+    3_more_examples.py (mode 'bernoulli' and 'poisson') on
+    RGSpace((size, size))'''
+
+    def __init__(self, mode=None):
+        self._mode = mode
+
+    def operators(self, c):
+        c['space'] = ift.RGSpace(2*(c['size'],))
+        power_space = ift.PowerSpace(c['space'].get_default_codomain())
+        c['A'] = _amplitude(power_space, -2 if self._mode is None else -3)
+        cf = ift.CorrelatedField(c['space'], c['A'])
+        if self._mode == 'poisson':
+            c['signal'] = cf.exp()
+            c['R'] = h.exposure_response(c['space'])
+        else:
+            c['signal'] = cf if self._mode is None else cf.sigmoid()
+            c['R'] = h.checkerboard_response(c['space'])
+        c['signal_response'] = c['R'] @ c['signal']
+        if self._mode == 'bernoulli':
+            c['signal_response'] = c['signal_response'].clip(1e-5, 1 - 1e-5)
+
+    def data(self, c):
+        sr = c['signal_response']
+        if self._mode is None:
+            N = ift.ScalingOperator(0.1, c['R'].target)
+            c['data'], c['ground_truth'] = h.generate_gaussian_data(sr, N)
+            lh = ift.GaussianEnergy(mean=c['data'],
+                                    inverse_covariance=N.inverse)(sr)
+        elif self._mode == 'poisson':
+            c['data'], c['ground_truth'] = h.generate_poisson_data(sr)
+            lh = ift.PoissonianEnergy(c['data']) @ sr
+        else:
+            c['data'], c['ground_truth'] = h.generate_bernoulli_data(sr)
+            lh = ift.BernoulliEnergy(c['data']) @ sr
+        ic_sampling = ift.GradientNormController(iteration_limit=100)
+        c['H'] = ift.StandardHamiltonian(lh, ic_sampling)
+
+    def kl(self, c):
+        c['workers'] = h.SampleWorkers(c['H'], seed=42)
+        mean = ift.MultiField.full(c['H'].domain, 0.)
+        c['KL'] = h.ParallelMetricGaussianKL(mean, c['workers'],
+                                             c['n_samples'])
+
+    def newton(self, c):
+        minimizer = ift.NewtonCG(
+            ift.GradInfNormController(tol=1e-6, iteration_limit=1))
+        c['KL'], _ = minimizer(c['KL'])
+
+    def plot(self, c):
+        h.plot_reconstruction_2d(c['data'], c['ground_truth'], c['KL'],
+                                 c['signal'], c['R'], c['A'], 'bench')
+
+
+PIPELINES = {
+    'wiener_filter': WienerFilterPipeline,
+    'critical_filter': CriticalFilterPipeline,
+    'bernoulli': lambda: CriticalFilterPipeline('bernoulli'),
+    'poisson': lambda: CriticalFilterPipeline('poisson'),
+}
+
+
+def _proc_status(field):
+    '''`field` of /proc/self/status in bytes, or None.'''
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])*1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    '''Resets the peak RSS of this process to its current RSS and returns
+    the latter, or returns None if that is not supported.'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return None
+    return _proc_status('VmRSS')
+
+
+def _maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+def _run_stage(conn, pipeline, stage, size, n_samples):
+    try:
+        os.chdir(tempfile.mkdtemp())
+        np.random.seed(42)
+        p = PIPELINES[pipeline]()
+        c = {'size': size, 'n_samples': n_samples}
+        for s in STAGES[:STAGES.index(stage)]:
+            getattr(p, s)(c)
+        # memory of the prerequisite stages is not attributed to this one
+        base = _reset_peak_rss()
+        peak = 'VmHWM'
+        if base is None or _proc_status(peak) is None:
+            base, peak = _maxrss(), None
+        t0 = time()
+        getattr(p, stage)(c)
+        dt = time() - t0
+        rss = _maxrss() if peak is None else _proc_status(peak)
+        if 'workers' in c:
+            c['workers'].close()
+        conn.send({'time': dt, 'rss_increase': max(rss - base, 0)})
+    except Exception:
+        conn.send({'error': traceback.format_exc()})
+
+
+def measure(pipeline, stage, size, n_samples, repeat=1):
+    '''Best wall time and the RSS increase of `repeat` runs of a stage,
+    each in a fresh process.'''
+    ctx = mp.get_context('fork')
+    best = None
+    for _ in range(repeat):
+        parent, child = ctx.Pipe()
+        p = ctx.Process(target=_run_stage,
+                        args=(child, pipeline, stage, size, n_samples))
+        p.start()
+        res = parent.recv()
+        p.join()
+        if 'error' in res:
+            return res
+        if best is None or res['time'] < best['time']:
+            best = res
+    return best
+
+
+def _key(r):
+    return '{pipeline}/{stage}/{size}/{n_samples}'.format(**r)
+
+
+def compare(results, baseline, threshold):
+    '''Returns the results which are slower or use more memory than their
+    baseline counterpart by more than `threshold` (relative).'''
+    base = {_key(r): r for r in baseline if 'time' in r}
+    res = []
+    for r in results:
+        b = base.get(_key(r))
+        if b is None or 'time' not in r:
+            continue
+        for q in ('time', 'rss_increase'):
+            if q in b and r[q] > b[q]*(1 + threshold):
+                res.append((_key(r), q, b[q], r[q]))
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Scaling benchmark of the tutorial pipeline stages')
+    parser.add_argument('--pipelines', nargs='+', default=sorted(PIPELINES))
+    parser.add_argument('--stages', nargs='+', default=STAGES)
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[64, 128, 256, 512, 1024, 2048])
+    parser.add_argument('--samples', nargs='+', type=int, default=[2, 5])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+    if args.baseline is not None and os.path.abspath(
+            args.baseline) == os.path.abspath(args.output):
+        parser.error('--output would overwrite the --baseline')
+
+    results = []
+    for pipeline in args.pipelines:
+        for size in args.sizes:
+            for stage in args.stages:
+                counts = args.samples if stage in SAMPLE_STAGES else [None]
+                for n in counts:
+                    r = measure(pipeline, stage, size, n, args.repeat)
+                    r.update(pipeline=pipeline, stage=stage, size=size,
+                             n_samples=n)
+                    results.append(r)
+                    if 'error' in r:
+                        print('{:40s} failed:\n{}'.format(_key(r), r['error']))
+                    else:
+                        print('{:40s} {:9.3f} s {:9.1f} MiB'.format(
+                            _key(r), r['time'], r['rss_increase']/2**20))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for key, q, old, new in regressions:
+            print('REGRESSION {} {}: {:.4g} -> {:.4g}'.format(
+                key, q, old, new))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
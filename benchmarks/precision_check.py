@@ -0,0 +1,77 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Runs the reconstruction of 2_critical_filter_solution.py with double and
+# with single precision storage and compares posterior mean and standard
+# deviation. The exit status is 1 if they deviate by more than the
+# tolerance, i.e. if storing data and samples in single precision is not
+# safe for this problem.
+#
+# Usage: python3 benchmarks/precision_check.py [size] [rtol]
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+rtol = float(sys.argv[2]) if len(sys.argv) > 2 else 1e-3
+
+
+def reconstruct(precision):
+    h.set_storage_precision(precision)
+    np.random.seed(42)
+    position_space = ift.RGSpace(2*(size,))
+    power_space = h.cached_power_space(position_space.get_default_codomain())
+    A = ift.SLAmplitude(target=power_space, n_pix=64, a=10, k0=.2, sm=-4,
+                        sv=.6, im=-2, iv=2.)
+    signal = ift.CorrelatedField(position_space, A)
+    R = h.checkerboard_response(position_space)
+    N = ift.ScalingOperator(0.1, R.target)
+    signal_response = R @ signal
+    data, ground_truth = h.generate_gaussian_data(signal_response, N)
+    likelihood = ift.GaussianEnergy(
+        mean=data, inverse_covariance=N.inverse)(signal_response)
+    ic_sampling = ift.GradientNormController(iteration_limit=100)
+    minimizer = ift.NewtonCG(
+        ift.GradInfNormController(name='Newton', tol=1e-6,
+                                  iteration_limit=30))
+    H = ift.StandardHamiltonian(likelihood, ic_sampling)
+    mean = ift.MultiField.full(H.domain, 0.)
+    with h.SampleWorkers(H, seed=42) as workers:
+        for _ in range(5):
+            KL = h.ParallelMetricGaussianKL(mean, workers, 5)
+            KL, _ = minimizer(KL)
+            mean = KL.position
+        KL = h.ParallelMetricGaussianKL(mean, workers, 20)
+        sc = h.summarize_samples(
+            (signal(KL.position + s) for s in KL.samples), quantiles=None)
+    return {'mean': sc.mean, 'std': ift.sqrt(sc.var)}
+
+
+reference = reconstruct('float64')
+candidate = reconstruct('float32')
+deviations, safe = h.compare_reconstructions(reference, candidate, rtol)
+for key, val in deviations.items():
+    print('relative deviation of posterior {}: {:.2e}'.format(key, val))
+print('float32 is {}safe at rtol={:g}'.format('' if safe else 'NOT ', rtol))
+sys.exit(0 if safe else 1)
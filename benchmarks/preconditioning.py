@@ -0,0 +1,84 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Conjugate gradient iterations of the sampling and of the inner Newton
+# solves on the checkerboard-masked critical filter problem of
+# 2_critical_filter_solution.py, without and with the harmonic-space
+# diagonal preconditioner, together with the final KL and the wall time.
+#
+# Usage: python3 benchmarks/preconditioning.py [size] [n_iterations]
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+size = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+n_iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+n_samples = 5
+
+np.random.seed(42)
+position_space = ift.RGSpace(2*(size,))
+power_space = h.cached_power_space(position_space.get_default_codomain())
+A = ift.SLAmplitude(target=power_space, n_pix=64, a=10, k0=.2, sm=-4, sv=.6,
+                    im=-2, iv=2.)
+signal = ift.CorrelatedField(position_space, A)
+R = h.checkerboard_response(position_space)
+N = ift.ScalingOperator(0.1, R.target)
+signal_response = R @ signal
+data, ground_truth = h.generate_gaussian_data(signal_response, N)
+likelihood = ift.GaussianEnergy(
+    mean=data, inverse_covariance=N.inverse)(signal_response)
+
+
+def run(preconditioner):
+    ic_sampling = h.CountingController(
+        ift.GradientNormController(iteration_limit=100))
+    H = h.SamplingHamiltonian(likelihood, ic_sampling, preconditioner)
+    minimizer = h.PreconditionedNewtonCG(
+        ift.GradInfNormController(name='Newton', tol=1e-6,
+                                  iteration_limit=10),
+        preconditioner)
+    mean = ift.MultiField.full(H.domain, 0.)
+    t0 = time()
+    # one in-process worker, so that the sampling controller counts
+    with h.SampleWorkers(H, n_workers=1, seed=42) as workers:
+        for _ in range(n_iterations):
+            KL = h.ParallelMetricGaussianKL(mean, workers, n_samples)
+            KL, _ = minimizer(KL)
+            mean = KL.position
+    return {
+        'sampling': ic_sampling.count,
+        'newton': minimizer.cg_iterations,
+        'kl': KL.value,
+        'time': time() - t0
+    }
+
+
+print('{:16s} {:>14s} {:>14s} {:>14s} {:>9s}'.format(
+    '', 'sampling CG', 'Newton CG', 'final KL', 'time'))
+for name, preconditioner in [('none', None),
+                             ('harmonic', h.HarmonicPreconditioner(A))]:
+    r = run(preconditioner)
+    print('{:16s} {:14d} {:14d} {:14.6e} {:8.2f}s'.format(
+        name, r['sampling'], r['newton'], r['kl'], r['time']))
@@ -0,0 +1,79 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Checks the streaming Wiener filter against the full-domain solve of
+# 1_wiener_filter_solution.py on a series which fits into memory. The data
+# are read from a memory-mapped .npy file and mean and variance are written
+# to .npy files. The exit status is 1 if the relative deviation of the mean
+# or the variance exceeds the tolerance.
+#
+# Usage: python3 benchmarks/streaming_wiener.py [n] [block_size] [rtol]
+
+import os
+import sys
+import tempfile
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 2**16
+block_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4096
+rtol = float(sys.argv[3]) if len(sys.argv) > 3 else 1e-3
+noise = 0.1
+
+
+def spectrum(k):
+    return 1/(10. + k**2.5)
+
+
+np.random.seed(42)
+position_space = ift.RGSpace(n)
+d, s = h.generate_wf_data(position_space, spectrum)
+
+t0 = time()
+harmonic_space = position_space.get_default_codomain()
+R = ift.GeometryRemover(position_space)
+wf = h.WienerFilter(R, ift.ScalingOperator(noise, R.target),
+                    ift.HartleyOperator(harmonic_space, target=position_space),
+                    ift.create_power_operator(harmonic_space, spectrum))
+m_full = wf.mean(ift.from_global_data(R.target, d)).to_global_data()
+var_full = wf.variance().to_global_data()
+t_full = time() - t0
+
+with tempfile.TemporaryDirectory() as tmp:
+    np.save(os.path.join(tmp, 'data.npy'), d)
+    data = np.load(os.path.join(tmp, 'data.npy'), mmap_mode='r')
+    t0 = time()
+    swf = h.StreamingWienerFilter(spectrum, noise, position_space.distances[0],
+                                  block_size)
+    m, var = swf.filter(data, os.path.join(tmp, 'mean.npy'),
+                        os.path.join(tmp, 'var.npy'))
+    t_stream = time() - t0
+    dev_m = np.linalg.norm(m - m_full)/np.linalg.norm(m_full)
+    dev_var = np.linalg.norm(var - var_full)/np.linalg.norm(var_full)
+    del m, var, data
+
+print('full domain: {:8.3f} s'.format(t_full))
+print('streaming:   {:8.3f} s (blocks of {})'.format(t_stream, block_size))
+print('relative deviation of mean:     {:.2e}'.format(dev_m))
+print('relative deviation of variance: {:.2e}'.format(dev_var))
+sys.exit(0 if max(dev_m, dev_var) < rtol else 1)
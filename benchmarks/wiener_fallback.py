@@ -0,0 +1,80 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# Checks the conjugate gradient path of WienerFilter against the spectral
+# solve. The problem of 1_wiener_filter_solution.py is set up twice, once
+# with the response wrapped so that it is not recognised as spectral. The
+# means are compared directly, the pixelwise variance of samples drawn with
+# block_cg against the exact variance. The exit status is 1 if a relative
+# deviation exceeds its tolerance.
+#
+# Usage: python3 benchmarks/wiener_fallback.py [n_samples] [batch_size]
+
+import os
+import sys
+from time import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import nifty5 as ift  # noqa: E402
+import helpers as h  # noqa: E402
+
+n_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+rtol_mean = 1e-4
+# statistical error of the variance estimate, averaged over the pixels
+rtol_var = 5*np.sqrt(2./n_samples/16)
+
+
+def spectrum(k):
+    return 1/(10. + k**2.5)
+
+
+np.random.seed(42)
+position_space = ift.RGSpace(256)
+d, s = h.generate_wf_data(position_space, spectrum)
+harmonic_space = position_space.get_default_codomain()
+HT = ift.HartleyOperator(harmonic_space, target=position_space)
+S_h = ift.create_power_operator(harmonic_space, spectrum)
+R = ift.GeometryRemover(position_space)
+N = ift.ScalingOperator(0.1, R.target)
+data = ift.from_global_data(R.target, d)
+
+spectral = h.WienerFilter(R, N, HT, S_h)
+fallback = h.WienerFilter(R @ ift.ScalingOperator(1., position_space), N,
+                          HT, S_h)
+assert spectral.fast and not fallback.fast
+
+m = spectral.mean(data).to_global_data()
+dev_mean = np.linalg.norm(fallback.mean(data).to_global_data() - m) \
+    / np.linalg.norm(m)
+
+t0 = time()
+samples = np.concatenate([
+    fallback.draw_samples(batch_size)
+    for _ in range(n_samples//batch_size)
+])
+t_samples = time() - t0
+var = spectral.variance().to_global_data()
+dev_var = abs(np.mean(samples**2)/np.mean(var) - 1)
+
+print('relative deviation of mean:     {:.2e}'.format(dev_mean))
+print('relative deviation of variance: {:.2e} ({} samples in {:.2f} s)'
+      .format(dev_var, len(samples), t_samples))
+sys.exit(0 if dev_mean < rtol_mean and dev_var < rtol_var else 1)
@@ -1,3 +1,76 @@
-from .generate_data import *
-from .plot import *
-from .responses import *
+import importlib
+import os
+
+# The submodules are imported on first access of one of their names, so
+# that e.g. data generation does not import the plotting stack.
+_exports = {
+    'cache': ('DiskCache', 'cache_key'),
+    'checkpoint': ('KLCheckpoint',),
+    'distributed': ('SlabMaskResponse', 'checkerboard_slab_response',
+                    'is_distributed', 'is_master', 'local_slab', 'ntask',
+                    'rank', 'rank_seed'),
+    'fft': ('fft_threads_from_environment', 'get_fft_threads',
+            'set_fft_threads'),
+    'generate_data': ('generate_bernoulli_data', 'generate_data_batch',
+                      'generate_gaussian_data', 'generate_mysterious_data',
+                      'generate_poisson_data', 'generate_wf_data'),
+    'geometry': ('cached_power_space',),
+    'multigrid': ('block_sum', 'coarse_space', 'multigrid_initial_mean',
+                  'prolong_position'),
+    'parallel': ('ParallelMetricGaussianKL', 'SampleWorkers'),
+    'plot': ('is_headless', 'plot_WF', 'plot_prior_samples_2d',
+             'plot_reconstruction_2d', 'plot_telemetry', 'power_plot',
+             'set_headless'),
+    'posterior': ('PosteriorSummary', 'summarize_samples'),
+    'precision': ('cast', 'compare_reconstructions', 'get_storage_precision',
+                  'set_storage_precision'),
+    'preconditioning': ('HarmonicPreconditioner', 'PreconditionedNewtonCG',
+                        'SamplingHamiltonian'),
+    'prior': ('PriorPredictive',),
+    'profiling': ('OperatorProfiler', 'profile_from_environment'),
+    'render': ('ImagePyramid', 'Renderer', 'display_image',
+               'set_async_plotting', 'set_display_pixels', 'wait_for_plots'),
+    'responses': ('MaskedExposureResponse', 'SparseResponse',
+                  'banded_exposure', 'cached_los_response',
+                  'checkerboard_response', 'exposure_response',
+                  'masked_exposure_response', 'psf_response',
+                  'radial_tomography_response', 'random_tomography_response',
+                  'tiled_mask'),
+    'results': ('PosteriorResult', 'ResultCache'),
+    'schedule': ('AdaptiveKLSchedule',),
+    'sparse_data': ('BernoulliData', 'PoissonCounts', 'SparseBernoulliEnergy',
+                    'SparsePoissonianEnergy', 'observed_pixels'),
+    'streaming': ('StreamingWienerFilter',),
+    'sweep': ('DEFAULT_AMPLITUDE', 'Scenario', 'ScenarioSweep'),
+    'telemetry': ('CountingController', 'TelemetryController',
+                  'TelemetryStream', 'read_telemetry'),
+    'wiener': ('WienerFilter', 'block_cg'),
+}
+_modules = {name: mod for mod, names in _exports.items() for name in names}
+__all__ = sorted(_modules)
+
+
+def __getattr__(name):
+    if name in _exports:
+        return importlib.import_module('.' + name, __name__)
+    if name not in _modules:
+        raise AttributeError(
+            "module '{}' has no attribute '{}'".format(__name__, name))
+    val = getattr(importlib.import_module('.' + _modules[name], __name__),
+                  name)
+    globals()[name] = val
+    return val
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if os.environ.get('NIFTY_TUTORIAL_FFT_THREADS', '') != '':
+    __getattr__('fft_threads_from_environment')()
+if os.environ.get('NIFTY_TUTORIAL_PROFILE', '') != '':
+    # the profiler instruments the operator classes which exist when it is
+    # enabled, so all of them are imported first
+    for _mod in _exports:
+        importlib.import_module('.' + _mod, __name__)
+    __getattr__('profile_from_environment')()
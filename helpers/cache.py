@@ -0,0 +1,156 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+
+def cache_key(*args):
+    '''Hashes strings, numbers, tuples, dicts, named functions and numpy
+    arrays into a hex digest.'''
+    h = hashlib.sha1()
+    for a in args:
+        if isinstance(a, np.ndarray):
+            a = np.ascontiguousarray(a)
+            h.update('{}{}'.format(a.dtype.str, a.shape).encode())
+            h.update(a.tobytes())
+        elif isinstance(a, (tuple, list)):
+            h.update(cache_key(*a).encode())
+        elif isinstance(a, dict):
+            h.update(cache_key(*sorted(a.items())).encode())
+        elif callable(a) and hasattr(a, '__qualname__'):
+            h.update('{}.{}'.format(a.__module__, a.__qualname__).encode())
+        else:
+            h.update(repr(a).encode())
+        h.update(b'|')
+    return h.hexdigest()
+
+
+class DiskCache(object):
+    '''Directory of named array sets with least-recently-used eviction.
+
+    Every entry is a subdirectory holding one uncompressed `.npy` file per
+    array, so that `load` can memory-map them. The modification time of an
+    entry is updated on every access and serves as LRU clock.
+
+    Parameters
+    ----------
+    name : str
+        Subdirectory of the cache root used by this cache.
+    max_bytes : int, optional
+        Size limit of this cache. Defaults to the environment variable
+        `NIFTY_TUTORIAL_CACHE_MB` (in MiB), or 1 GiB.
+    root : str, optional
+        Defaults to the environment variable `NIFTY_TUTORIAL_CACHE`, or
+        `~/.cache/nifty_tutorial`.
+    '''
+
+    def __init__(self, name, max_bytes=None, root=None):
+        if root is None:
+            root = os.environ.get(
+                'NIFTY_TUTORIAL_CACHE',
+                os.path.join(os.path.expanduser('~'), '.cache',
+                             'nifty_tutorial'))
+        if max_bytes is None:
+            max_bytes = float(os.environ.get('NIFTY_TUTORIAL_CACHE_MB',
+                                             1024))*2**20
+        self._dir = os.path.join(root, name)
+        self._max_bytes = int(max_bytes)
+
+    @property
+    def directory(self):
+        return self._dir
+
+    def _path(self, key):
+        return os.path.join(self._dir, key)
+
+    def __contains__(self, key):
+        return os.path.isdir(self._path(key))
+
+    def load(self, key, mmap_mode='r'):
+        '''Returns a dict of (memory-mapped) arrays, or None on a miss.'''
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return {
+                f[:-4]: np.load(os.path.join(path, f), mmap_mode=mmap_mode)
+                for f in os.listdir(path) if f.endswith('.npy')
+            }
+        except FileNotFoundError:
+            # missing, or evicted by another process meanwhile
+            return None
+
+    def store(self, key, arrays):
+        '''Writes the arrays to a temporary directory and moves it into
+        place. Concurrent writers of the same key are safe: the first one to
+        finish wins and the others discard their copy.'''
+        path = self._path(key)
+        os.makedirs(self._dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=key + '.tmp', dir=self._dir)
+        try:
+            for name, arr in arrays.items():
+                np.save(os.path.join(tmp, name + '.npy'), np.asarray(arr))
+            try:
+                os.replace(tmp, path)
+            except OSError:
+                # a non-empty target cannot be replaced
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def _entries(self):
+        if not os.path.isdir(self._dir):
+            return []
+        res = []
+        for key in os.listdir(self._dir):
+            path = self._path(key)
+            if '.tmp' in key:
+                continue
+            try:
+                size = sum(
+                    os.path.getsize(os.path.join(path, f))
+                    for f in os.listdir(path))
+                res.append((os.path.getmtime(path), size, key))
+            except (FileNotFoundError, NotADirectoryError):
+                # not an entry, or removed by another process meanwhile
+                continue
+        return sorted(res)
+
+    def size(self):
+        return sum(e[1] for e in self._entries())
+
+    def evict(self, keep=None):
+        '''Removes least recently used entries until the cache fits into
+        its size limit. The entry `keep` is never removed.'''
+        entries = self._entries()
+        total = sum(e[1] for e in entries)
+        for _, size, key in entries:
+            if total <= self._max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
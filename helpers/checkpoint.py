@@ -0,0 +1,151 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import json
+import os
+
+import numpy as np
+
+import nifty5 as ift
+
+from .cache import cache_key
+from .distributed import is_distributed, rank
+
+
+class KLCheckpoint(object):
+    '''Persists the outer KL iteration loop of a reconstruction.
+
+    After every completed outer step, `save` writes the current mean, the
+    iteration counter, the state of `np.random` and, if given, the seed
+    stream of the `SampleWorkers` and the state of the AdaptiveKLSchedule
+    to `<directory>/<name>.npz`. `resume` restores all of them, so that a
+    rerun continues after the last completed step with the same random
+    numbers and sample count as an uninterrupted run.
+
+    Along with them, a hash of `config` and the shapes of the domain of the
+    mean are stored. `resume` refuses checkpoints written with a different
+    configuration or grid.
+
+    With MPI, every task writes its slab of the mean and its random state to
+    `<directory>/<name>.rank<r>.npz`; the checkpoint can only be resumed
+    with the same number of tasks.
+
+    Parameters
+    ----------
+    name : str
+        Name of the checkpoint file.
+    workers : SampleWorkers, optional
+        Pool whose sample seed stream is stored along with the mean.
+    schedule : AdaptiveKLSchedule, optional
+        Schedule whose sample count and convergence are stored.
+    config : tuple, optional
+        Everything the run depends on (data, seeds, settings), as accepted
+        by `cache_key`.
+    directory : str
+        Directory of the checkpoint file. Defaults to the environment
+        variable `NIFTY_TUTORIAL_CHECKPOINTS`, or the working directory.
+    sampling_only : bool, optional
+        If True, `resume` skips the whole minimization and only the final
+        sampling is done at the stored position. Defaults to the environment
+        variable `NIFTY_TUTORIAL_SAMPLING_ONLY`.
+    '''
+
+    def __init__(self, name, workers=None, directory=None,
+                 sampling_only=None, schedule=None, config=()):
+        if directory is None:
+            directory = os.environ.get('NIFTY_TUTORIAL_CHECKPOINTS', '.')
+        if sampling_only is None:
+            sampling_only = os.environ.get('NIFTY_TUTORIAL_SAMPLING_ONLY',
+                                           '0') not in ('', '0')
+        if is_distributed():
+            name = '{}.rank{}'.format(name, rank())
+        self._fname = os.path.join(directory, '{}.npz'.format(name))
+        self._workers = workers
+        self._schedule = schedule
+        self._config = cache_key(*config)
+        self._sampling_only = bool(sampling_only)
+
+    @property
+    def filename(self):
+        return self._fname
+
+    def save(self, iteration, mean):
+        dct = {'iteration': iteration, 'config': self._config}
+        for key in mean.keys():
+            dct['mean:' + key] = mean[key].local_data
+            dct['shape:' + key] = np.array(mean[key].shape)
+        rng = np.random.get_state()
+        dct['rng_keys'], dct['rng_pos'] = rng[1], rng[2]
+        dct['rng_gauss'] = np.array([rng[3], rng[4]])
+        if self._workers is not None:
+            entropy, spawned = self._workers.get_state()
+            dct['seed_entropy'] = str(entropy)
+            dct['seed_spawned'] = spawned
+        if self._schedule is not None:
+            dct['schedule'] = json.dumps(self._schedule.get_state())
+        d = os.path.dirname(self._fname)
+        if d != '':
+            os.makedirs(d, exist_ok=True)
+        tmp = self._fname + '.tmp.npz'
+        np.savez(tmp, **dct)
+        os.replace(tmp, self._fname)
+
+    def resume(self, initial_mean, n_iterations):
+        '''Returns the mean and the index of the first outer step which
+        still has to be done.
+
+        Without a checkpoint file, this is `(initial_mean, 0)`. In
+        sampling-only mode, the index is `n_iterations`, i.e. the outer loop
+        is skipped entirely. Raises ValueError if the checkpoint was written
+        with another configuration or for another domain.
+        '''
+        if not os.path.exists(self._fname):
+            if self._sampling_only:
+                raise RuntimeError(
+                    'sampling-only mode requires {}'.format(self._fname))
+            return initial_mean, 0
+        dom = initial_mean.domain
+        with np.load(self._fname) as f:
+            keys = set(k[5:] for k in f.files if k.startswith('mean:'))
+            if keys != set(dom.keys()) or any(
+                    tuple(f['shape:' + k]) != dom[k].shape for k in keys):
+                raise ValueError(
+                    '{} does not match the model'.format(self._fname))
+            if str(f['config']) != self._config:
+                raise ValueError(
+                    '{} was written with another configuration, remove it '
+                    'to start over'.format(self._fname))
+            mean = ift.MultiField.from_dict(
+                {k: ift.from_local_data(dom[k], f['mean:' + k])
+                 for k in dom.keys()}, dom)
+            iteration = int(f['iteration'])
+            gauss = f['rng_gauss']
+            np.random.set_state(('MT19937', f['rng_keys'],
+                                 int(f['rng_pos']), int(gauss[0]),
+                                 float(gauss[1])))
+            if self._workers is not None and 'seed_entropy' in f.files:
+                self._workers.set_state((int(str(f['seed_entropy'])),
+                                         int(f['seed_spawned'])))
+            if self._schedule is not None and 'schedule' in f.files:
+                self._schedule.set_state(json.loads(str(f['schedule'])))
+        if self._sampling_only:
+            iteration = n_iterations
+        return mean, min(iteration, n_iterations)
+
+    def clear(self):
+        if os.path.exists(self._fname):
+            os.remove(self._fname)
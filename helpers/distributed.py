@@ -0,0 +1,115 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+# NIFTy distributes every field over the MPI tasks in slabs along its first
+# axis when it is run with more than one task (`mpirun -np 4 python3 ...`,
+# requires mpi4py). The harmonic transforms then redistribute the data with
+# a transpose, so that each task only ever holds its share of a field. The
+# functions here let the helpers work in that mode.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .responses import _tile_index
+
+
+def ntask():
+    return getattr(ift.dobj, 'ntask', 1)
+
+
+def rank():
+    return getattr(ift.dobj, 'rank', 0)
+
+
+def is_master():
+    return rank() == 0
+
+
+def is_distributed():
+    return ntask() > 1
+
+
+def rank_seed(seed):
+    '''Seed for `np.random` in this task.
+
+    Random fields are drawn slab by slab from the local `np.random`, so the
+    tasks need different seeds or their slabs would be identical. Without
+    MPI, this is `seed` itself.
+    '''
+    if not is_distributed():
+        return seed
+    return int(np.random.SeedSequence([seed, rank()]).generate_state(1)[0])
+
+
+def local_slab(domain):
+    '''Range of the first axis of `domain` held by this task.'''
+    shape = ift.DomainTuple.make(domain).shape
+    lo = ift.dobj.ibegin_from_shape(shape)[0]
+    return slice(lo, lo + ift.dobj.local_shape(shape)[0])
+
+
+class SlabMaskResponse(ift.LinearOperator):
+    '''Mask and geometry removal which act on the local slab only.
+
+    Unlike MaskOperator, which gathers the whole field to pick the observed
+    pixels, the target keeps the shape of the domain (as UnstructuredDomain,
+    distributed like it) and unobserved pixels are set to zero. Data there
+    are zero as well, so they do not enter a Gaussian likelihood, and the
+    operator needs no communication.
+
+    Parameters
+    ----------
+    domain : Domain, tuple of Domain or DomainTuple
+        The position space.
+    flags : callable
+        Returns the flags (True for unobserved pixels) of the rows of the
+        given slice of the first axis, so that no task needs the flags of
+        the whole domain.
+    '''
+
+    def __init__(self, domain, flags):
+        self._domain = ift.DomainTuple.make(domain)
+        self._target = ift.DomainTuple.make(
+            ift.UnstructuredDomain(self._domain.shape))
+        self._capability = self.TIMES | self.ADJOINT_TIMES
+        slab = local_slab(self._domain)
+        local_shape = (slab.stop - slab.start,) + self._domain.shape[1:]
+        self._observed = ~np.broadcast_to(flags(slab),
+                                          local_shape).astype(bool)
+
+    def apply(self, x, mode):
+        self._check_input(x, mode)
+        res = x.local_data*self._observed
+        tgt = self._target if mode == self.TIMES else self._domain
+        return ift.from_local_data(tgt, res)
+
+
+def checkerboard_slab_response(position_space, n_tiles=8):
+    '''`checkerboard_response` as SlabMaskResponse, for distributed runs.'''
+    shape = position_space.shape
+    n_tiles = np.broadcast_to(n_tiles, (len(shape),))
+
+    def flags(slab):
+        idx = [_tile_index(n, t) for n, t in zip(shape, n_tiles)]
+        idx[0] = idx[0][slab]
+        parity = sum(
+            i.reshape((-1,) + (1,)*(len(shape) - 1 - k))
+            for k, i in enumerate(idx))
+        return parity % 2 == 1
+
+    return SlabMaskResponse(position_space, flags)
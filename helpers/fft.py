@@ -0,0 +1,83 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import functools
+import os
+
+import nifty5 as ift
+
+_nthreads = [1]
+_originals = {}
+
+
+def _patch_pypocketfft():
+    # NIFTy versions without `ift.fft.set_nthreads` call the transforms of
+    # pypocketfft without `nthreads`; inject it into every transform that
+    # accepts it. NIFTy looks the functions up on the module at call time.
+    try:
+        import pypocketfft
+    except ImportError:
+        return False
+    for name in dir(pypocketfft):
+        f = getattr(pypocketfft, name)
+        if name in _originals or name.startswith('_') or not callable(f):
+            continue
+        if 'nthreads' not in (f.__doc__ or ''):
+            continue
+        _originals[name] = f
+
+        @functools.wraps(f)
+        def wrapper(*args, _f=f, **kwargs):
+            kwargs.setdefault('nthreads', _nthreads[0])
+            return _f(*args, **kwargs)
+
+        setattr(pypocketfft, name, wrapper)
+    return len(_originals) > 0
+
+
+def set_fft_threads(n=None):
+    '''Sets the number of threads of all harmonic transforms
+    (HarmonicTransformOperator, HartleyOperator, FFTOperator and everything
+    built on them).
+
+    `n=None` or 0 uses all available cores. Returns the previous value.
+    '''
+    if not n:
+        n = len(os.sched_getaffinity(0)) if hasattr(
+            os, 'sched_getaffinity') else os.cpu_count()
+    old = get_fft_threads()
+    _nthreads[0] = int(n)
+    fft = getattr(ift, 'fft', None)
+    if fft is not None and hasattr(fft, 'set_nthreads'):
+        fft.set_nthreads(_nthreads[0])
+    elif not _patch_pypocketfft() and _nthreads[0] > 1:
+        raise RuntimeError('this pypocketfft does not support threads')
+    return old
+
+
+def get_fft_threads():
+    fft = getattr(ift, 'fft', None)
+    if fft is not None and hasattr(fft, 'nthreads'):
+        return fft.nthreads()
+    return _nthreads[0]
+
+
+def fft_threads_from_environment():
+    '''Applies `NIFTY_TUTORIAL_FFT_THREADS` (0 for all cores), if set.'''
+    n = os.environ.get('NIFTY_TUTORIAL_FFT_THREADS', '')
+    if n != '':
+        set_fft_threads(int(n))
@@ -15,15 +15,19 @@
 #
 # NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
 
+import os
+
 import numpy as np
 
 import nifty5 as ift
 
+from .precision import cast, get_storage_precision
+
 
 def generate_gaussian_data(signal_response, noise_covariance):
     ground_truth = ift.from_random('normal', signal_response.domain)
     d = signal_response(ground_truth) + noise_covariance.draw_sample()
-    return d, ground_truth
+    return cast(d), ground_truth
 
 
 def generate_poisson_data(signal_response):
@@ -52,3 +56,80 @@ def generate_wf_data(domain, spectrum):
 
 def generate_mysterious_data(domain):
     return generate_wf_data(domain, lambda k: 5/((7**2 - k**2)**2 + 3**2*k**2))
+
+
+def _open_memmap(fname, shape, dtype):
+    return np.lib.format.open_memmap(fname, mode='w+', dtype=dtype,
+                                     shape=shape)
+
+
+def generate_data_batch(prefix, signal_response, n_realizations,
+                        likelihood='gauss', noise_covariance=None, seed=42,
+                        chunk_size=16):
+    '''Generates many mock data sets and writes them to `.npy` files.
+
+    Realisation `i` draws its ground truth and Gaussian noise from its own
+    stream, spawned from `seed` with `np.random.SeedSequence`, so that they
+    do not depend on `chunk_size` or the other realisations. Poisson and
+    Bernoulli data are drawn for a whole chunk at once from one stream per
+    chunk, spawned after those of the realisations; they are therefore
+    reproducible for a given `chunk_size` only. Data and ground truth are
+    written chunk by chunk to memory-mapped files, so only one chunk is ever
+    held in memory. The global `np.random` state is left untouched.
+
+    Returns a dict which maps 'data' and the keys of the ground truth
+    ('ground_truth' for a single field) to the file names.
+    '''
+    if likelihood not in ('gauss', 'poisson', 'bernoulli'):
+        raise ValueError('likelihood type not implemented')
+    if likelihood == 'gauss' and noise_covariance is None:
+        raise ValueError('gauss needs a noise covariance')
+    dom, tgt = signal_response.domain, signal_response.target
+    multi = isinstance(dom, ift.MultiDomain)
+    d = os.path.dirname(prefix)
+    if d != '':
+        os.makedirs(d, exist_ok=True)
+    dtype = {'gauss': get_storage_precision(), 'poisson': np.int32,
+             'bernoulli': np.uint8}[likelihood]
+    fnames = {'data': '{}_data.npy'.format(prefix)}
+    out = {'data': _open_memmap(fnames['data'],
+                                (n_realizations,) + tgt.shape, dtype)}
+    keys = dom.keys() if multi else ['ground_truth']
+    for key in keys:
+        fnames[key] = '{}_{}.npy'.format(
+            prefix, key if not multi else 'truth_' + key)
+        shp = dom[key].shape if multi else dom.shape
+        out[key] = _open_memmap(fnames[key], (n_realizations,) + shp,
+                                np.float64)
+
+    state = np.random.get_state()
+    root = np.random.SeedSequence(seed)
+    streams = root.spawn(n_realizations)
+    try:
+        for lo in range(0, n_realizations, chunk_size):
+            hi = min(lo + chunk_size, n_realizations)
+            rates = []
+            for i in range(lo, hi):
+                np.random.seed(streams[i].generate_state(1)[0])
+                gt = ift.from_random('normal', dom)
+                sr = signal_response(gt)
+                if likelihood == 'gauss':
+                    sr = sr + noise_covariance.draw_sample()
+                rates.append(sr.to_global_data())
+                gt = gt.to_global_data()
+                for key in keys:
+                    out[key][i] = gt[key] if multi else gt
+            rates = np.stack(rates)
+            if likelihood == 'gauss':
+                out['data'][lo:hi] = rates
+            else:
+                rng = np.random.default_rng(root.spawn(1)[0])
+                if likelihood == 'poisson':
+                    out['data'][lo:hi] = rng.poisson(rates)
+                else:
+                    out['data'][lo:hi] = rng.random(rates.shape) < rates
+            for arr in out.values():
+                arr.flush()
+    finally:
+        np.random.set_state(state)
+    return fnames
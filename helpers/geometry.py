@@ -0,0 +1,74 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .cache import DiskCache, cache_key
+from .distributed import is_distributed
+
+
+def cached_power_space(harmonic_space, binbounds=None, cache=None):
+    '''`ift.PowerSpace(harmonic_space, binbounds)` with its binning cached on
+    disk.
+
+    PowerSpace keeps the expensive part of its construction, the k-lengths
+    of all harmonic pixels binned into power spectrum bins, in the in-memory
+    cache `PowerSpace._powerIndexCache`. This function persists that entry
+    in `cache` (by default `DiskCache('geometry')`), keyed by the shape and
+    distances of `harmonic_space`, and injects the memory-mapped arrays into
+    the in-memory cache on later runs, so that the binning is skipped.
+
+    With MPI, the cached entry holds the slab of the pixel index of one
+    task, so the disk cache is not used.
+    '''
+    # relies on the private `_powerIndexCache` of NIFTy 5, a dict from
+    # (harmonic space, binbounds tuple or None) to (binbounds, pindex,
+    # k_lengths, dvol); without it, PowerSpace is built uncached
+    mem = getattr(ift.PowerSpace, '_powerIndexCache', None)
+    if mem is None or is_distributed():
+        return ift.PowerSpace(harmonic_space, binbounds)
+    if cache is None:
+        cache = DiskCache('geometry')
+    bb = None if binbounds is None else np.asarray(binbounds, np.float64)
+    key = cache_key('PowerSpace', type(harmonic_space).__name__,
+                    harmonic_space.shape, harmonic_space.distances, bb)
+    mem_key = (harmonic_space, None if bb is None else tuple(bb))
+    if mem.get(mem_key) is None:
+        arrs = cache.load(key)
+        if arrs is not None:
+            n = len(arrs['is_none'])
+            entry = [
+                None if arrs['is_none'][i] else arrs['e{}'.format(i)]
+                for i in range(n)
+            ]
+            # PowerSpace compares its binbounds as a tuple
+            if entry[0] is not None:
+                entry[0] = tuple(float(b) for b in entry[0])
+            mem[mem_key] = tuple(entry)
+    if mem.get(mem_key) is not None:
+        return ift.PowerSpace(harmonic_space, binbounds)
+    res = ift.PowerSpace(harmonic_space, binbounds)
+    entry = mem.get(mem_key)
+    if entry is not None:
+        arrs = {'is_none': np.array([e is None for e in entry])}
+        for i, e in enumerate(entry):
+            if e is not None:
+                arrs['e{}'.format(i)] = np.asarray(e)
+        cache.store(key, arrs)
+    return res
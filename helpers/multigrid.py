@@ -0,0 +1,138 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .parallel import ParallelMetricGaussianKL, SampleWorkers
+
+
+def coarse_space(position_space, factor):
+    '''RGSpace covering the same volume with `factor` times fewer pixels
+    per axis.'''
+    shp = position_space.shape
+    if any(n % factor != 0 for n in shp):
+        raise ValueError('shape not divisible by {}'.format(factor))
+    return ift.RGSpace([n//factor for n in shp],
+                       [d*factor for d in position_space.distances])
+
+
+def block_sum(arr, factor):
+    '''Sums blocks of `factor` pixels per axis.'''
+    shp = []
+    for n in arr.shape:
+        shp += [n//factor, factor]
+    return arr.reshape(shp).sum(axis=tuple(range(1, len(shp), 2)))
+
+
+def _embed_harmonic(arr, shape):
+    '''Copies the modes of a harmonic array to the same modes of a larger
+    harmonic grid.'''
+    idx = [np.fft.fftfreq(n, 1./n).astype(int) for n in arr.shape]
+    res = np.zeros(shape)
+    res[np.ix_(*[i % n for i, n in zip(idx, shape)])] = arr
+    return res
+
+
+def prolong_position(position, correlated_field_coarse,
+                     correlated_field_fine, factor):
+    '''Maps a position of the coarse model to the fine model.
+
+    Parameters whose shape does not depend on the grid (those of the
+    amplitude model) are copied. Excitations are embedded mode by mode into
+    the finer harmonic grid and rescaled such that the fine correlated
+    field matches the coarse one on the coarse pixels in a least-squares
+    sense. This makes the mapping independent of the normalisation
+    conventions of the harmonic transforms.
+    '''
+    dom = correlated_field_fine.domain
+    vals, scaled = {}, []
+    for key in dom.keys():
+        c = position[key].to_global_data()
+        if c.shape == dom[key].shape:
+            vals[key] = c
+        else:
+            vals[key] = _embed_harmonic(c, dom[key].shape)
+            scaled.append(key)
+    fine = ift.MultiField.from_global_data(dom, vals)
+    if len(scaled) == 0:
+        return fine
+    s_c = correlated_field_coarse(position.extract(
+        correlated_field_coarse.domain)).to_global_data()
+    s_f = correlated_field_fine(fine).to_global_data()
+    s_f = s_f[tuple(slice(None, None, factor) for _ in s_f.shape)]
+    gamma = np.vdot(s_f, s_c)/np.vdot(s_f, s_f)
+    for key in scaled:
+        vals[key] = vals[key]*gamma
+    return ift.MultiField.from_global_data(dom, vals)
+
+
+def multigrid_initial_mean(build, position_space, factors=(8, 4, 2),
+                           n_iterations=3, n_samples=3, minimizer=None,
+                           seed=42):
+    '''Coarse-to-fine warm start for a correlated field reconstruction.
+
+    The problem is solved with a few KL iterations on grids which are
+    `factors` times coarser than `position_space`, from coarsest to finest.
+    Each result is prolongated to the next level with `prolong_position` and
+    serves as its starting point.
+
+    Parameters
+    ----------
+    build : callable
+        `build(space, factor)` returns the StandardHamiltonian and the
+        (linear in the excitations) correlated field of the problem on the
+        RGSpace `space`, which is `factor` times coarser than
+        `position_space`. It is called with `factor=1` for the final level.
+    position_space : RGSpace
+        Space of the full-resolution problem.
+    factors : tuple of int
+        Coarsening factors of the levels, in decreasing order.
+    n_iterations, n_samples : int
+        Outer KL iterations and samples per coarse level.
+    minimizer : Minimizer, optional
+        Defaults to NewtonCG with a GradInfNormController(tol=1e-6,
+        iteration_limit=10).
+
+    Returns
+    -------
+    H, correlated_field, MultiField
+        The full-resolution Hamiltonian, correlated field and the initial
+        mean for its KL iterations.
+    '''
+    if minimizer is None:
+        minimizer = ift.NewtonCG(
+            ift.GradInfNormController(tol=1e-6, iteration_limit=10))
+    mean, cf_prev, fct_prev = None, None, None
+    for fct in tuple(factors) + (1,):
+        space = position_space if fct == 1 else coarse_space(
+            position_space, fct)
+        H, cf = build(space, fct)
+        if mean is None:
+            mean = ift.MultiField.full(H.domain, 0.)
+        else:
+            pos = prolong_position(mean, cf_prev, cf, fct_prev//fct)
+            mean = ift.MultiField.full(H.domain, 0.).unite(pos)
+        if fct == 1:
+            return H, cf, mean
+        with SampleWorkers(H, seed=seed) as workers:
+            for _ in range(n_iterations):
+                KL = ParallelMetricGaussianKL(mean, workers, n_samples)
+                KL, _ = minimizer(KL)
+                mean = KL.position
+        cf_prev, fct_prev = cf, fct
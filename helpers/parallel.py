@@ -0,0 +1,394 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import multiprocessing as mp
+import os
+import traceback
+
+import numpy as np
+
+import nifty5 as ift
+
+from .distributed import is_distributed, rank_seed
+from .precision import cast
+
+
+def _partial_sum(values):
+    res = None
+    for v in values:
+        if v is not None:
+            res = v if res is None else res + v
+    return res
+
+
+class _SampleSet(object):
+    '''Samples held by one worker together with the cached metrics of the
+    most recently requested position.'''
+
+    def __init__(self, hamiltonian):
+        self._hamiltonian = hamiltonian
+        self._samples = []
+        self._token = None
+        self._metrics = None
+
+    def draw(self, mean, point_estimates, seeds):
+        lin = ift.Linearization.make_partial_var(mean, point_estimates, True)
+        met = self._hamiltonian(lin).metric
+        cg = getattr(self._hamiltonian, 'sampling_iterations', 0)
+        self._samples = []
+        # NIFTy draws from the global np.random, whose state the caller
+        # gets back unchanged
+        state = np.random.get_state()
+        try:
+            for seed in seeds:
+                np.random.seed(rank_seed(seed))
+                self._samples.append(
+                    cast(met.draw_sample(from_inverse=True)))
+        finally:
+            np.random.set_state(state)
+        self._token, self._metrics = None, None
+        return getattr(self._hamiltonian, 'sampling_iterations', 0) - cg
+
+    def energy(self, position, constants):
+        lin = ift.Linearization.make_partial_var(position, constants)
+        v, g = [], None
+        for s in self._samples:
+            tmp = self._hamiltonian(lin + s)
+            v.append(tmp.val.local_data[()])
+            g = tmp.gradient if g is None else g + tmp.gradient
+        return v, g
+
+    def metric(self, token, position, constants, x):
+        if self._token != token:
+            lin = ift.Linearization.make_partial_var(position, constants)
+            lin = lin.with_want_metric()
+            self._metrics = [
+                self._hamiltonian(lin + s).metric for s in self._samples
+            ]
+            self._token = token
+        return _partial_sum(m(x) for m in self._metrics)
+
+    def samples(self):
+        return self._samples
+
+    def sample(self, i):
+        return self._samples[i]
+
+
+def _worker_loop(conn, hamiltonian):
+    state = _SampleSet(hamiltonian)
+    while True:
+        cmd, args = conn.recv()
+        if cmd == 'close':
+            break
+        try:
+            conn.send(('ok', getattr(state, cmd)(*args)))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+    conn.close()
+
+
+class SampleWorkers(object):
+    '''Pool of processes which draw and evaluate the samples of a
+    `ParallelMetricGaussianKL`.
+
+    Every worker owns a contiguous block of the samples and keeps them in
+    memory, so only positions, partial sums and metric applications travel
+    between processes. The workers are forked and therefore inherit the
+    Hamiltonian without pickling it.
+
+    Each sample is drawn with its own seed, spawned from `seed` via
+    `np.random.SeedSequence`. The samples do therefore not depend on the
+    number of workers, and `n_workers=1` evaluates everything in the
+    calling process. The state of `np.random` of the calling process is
+    not changed by drawing.
+
+    With MPI, every task holds a slab of all samples and the workers are
+    not forked, i.e. `n_workers` is 1.
+
+    Parameters
+    ----------
+    hamiltonian : StandardHamiltonian
+        The Hamiltonian whose KL is to be approximated.
+    n_workers : int, optional
+        Number of processes. Defaults to the environment variable
+        `NIFTY_TUTORIAL_WORKERS`, or 1 if it is not set.
+    seed : int
+        Root seed of the sample streams.
+
+    To precondition the conjugate gradient which draws the samples, pass a
+    SamplingHamiltonian.
+    '''
+
+    def __init__(self, hamiltonian, n_workers=None, seed=42):
+        if n_workers is None:
+            n_workers = int(os.environ.get('NIFTY_TUTORIAL_WORKERS', 1))
+        if is_distributed():
+            # forking an MPI process is not safe
+            n_workers = 1
+        self._hamiltonian = hamiltonian
+        self._n_workers = max(1, int(n_workers))
+        self._seeds = np.random.SeedSequence(seed)
+        self._generation = 0
+        self._energies = 0
+        self._metric_applications = 0
+        self._sampling_iterations = 0
+        self._blocks = []
+        self._local = None
+        self._procs, self._conns = [], []
+        if self._n_workers == 1:
+            self._local = _SampleSet(hamiltonian)
+            return
+        ctx = mp.get_context('fork')
+        for _ in range(self._n_workers):
+            parent, child = ctx.Pipe()
+            p = ctx.Process(
+                target=_worker_loop,
+                args=(child, hamiltonian),
+                daemon=True)
+            p.start()
+            child.close()
+            self._procs.append(p)
+            self._conns.append(parent)
+
+    @property
+    def hamiltonian(self):
+        return self._hamiltonian
+
+    @property
+    def n_workers(self):
+        return self._n_workers
+
+    @property
+    def generation(self):
+        return self._generation
+
+    @property
+    def evaluations(self):
+        '''Cost of the work done so far in units of one evaluation for one
+        sample: energies, metric applications and, if the Hamiltonian is a
+        SamplingHamiltonian, iterations of the sampling conjugate
+        gradient.'''
+        return (self._energies + self._metric_applications +
+                self._sampling_iterations)
+
+    @property
+    def metric_applications(self):
+        '''Metric applications (one per sample) done so far.'''
+        return self._metric_applications
+
+    @property
+    def sampling_iterations(self):
+        '''Iterations of the sampling conjugate gradient done so far, if the
+        Hamiltonian is a SamplingHamiltonian, else 0.'''
+        return self._sampling_iterations
+
+    def get_state(self):
+        '''Returns the state of the sample seed stream as
+        `(entropy, n_children_spawned)`.'''
+        return self._seeds.entropy, self._seeds.n_children_spawned
+
+    def set_state(self, state):
+        entropy, spawned = state
+        self._seeds = np.random.SeedSequence(
+            entropy, n_children_spawned=spawned)
+
+    def _call(self, cmd, args):
+        if self._local is not None:
+            return [getattr(self._local, cmd)(*args[0])]
+        for conn, a in zip(self._conns, args):
+            conn.send((cmd, a))
+        res = []
+        for conn in self._conns:
+            status, val = conn.recv()
+            if status == 'error':
+                raise RuntimeError('sample worker failed:\n' + val)
+            res.append(val)
+        return res
+
+    def _call_one(self, i, cmd, args):
+        if self._local is not None:
+            return getattr(self._local, cmd)(*args)
+        self._conns[i].send((cmd, args))
+        status, val = self._conns[i].recv()
+        if status == 'error':
+            raise RuntimeError('sample worker failed:\n' + val)
+        return val
+
+    def draw(self, mean, n_samples, point_estimates=[]):
+        seeds = [
+            ss.generate_state(1)[0] for ss in self._seeds.spawn(n_samples)
+        ]
+        bounds = np.linspace(0, n_samples, self._n_workers + 1).astype(int)
+        self._blocks = [
+            seeds[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])
+        ]
+        self._sampling_iterations += sum(self._call(
+            'draw', [(mean, point_estimates, b) for b in self._blocks]))
+        self._generation += 1
+        return self._generation
+
+    def energy(self, position, constants):
+        '''Returns the Hamiltonian of every sample and the sum of their
+        gradients.'''
+        res = self._call('energy', [(position, constants)]*self._n_workers)
+        values = np.array([v for r in res for v in r[0]])
+        self._energies += values.size
+        return values, _partial_sum(r[1] for r in res)
+
+    def apply_metric(self, token, position, constants, x):
+        args = [(token, position, constants, x)]*self._n_workers
+        self._metric_applications += sum(len(b) for b in self._blocks)
+        return _partial_sum(self._call('metric', args))
+
+    def samples(self):
+        return tuple(
+            s for block in self._call('samples', [()]*self._n_workers)
+            for s in block)
+
+    def iter_samples(self):
+        '''Yields the samples one by one, so that the calling process only
+        holds the current one.'''
+        for i, block in enumerate(self._blocks):
+            for j in range(len(block)):
+                yield self._call_one(i, 'sample', (j,))
+
+    def close(self):
+        for conn in self._conns:
+            conn.send(('close', None))
+            conn.close()
+        for p in self._procs:
+            p.join()
+        self._procs, self._conns = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class _ParallelKLMetric(ift.EndomorphicOperator):
+    def __init__(self, kl):
+        self._domain = kl.position.domain
+        self._capability = self.TIMES | self.ADJOINT_TIMES
+        self._kl = kl
+
+    def apply(self, x, mode):
+        self._check_input(x, mode)
+        return self._kl.apply_metric(x)
+
+
+class ParallelMetricGaussianKL(ift.Energy):
+    '''Drop-in replacement for `ift.MetricGaussianKL` which spreads the
+    samples over the processes of a `SampleWorkers` pool.
+
+    Sampling, energy, gradient and metric are evaluated by the workers on
+    their share of the samples and summed up in the calling process.
+
+    Parameters
+    ----------
+    mean : MultiField
+        Mean of the Gaussian probability distribution.
+    workers : SampleWorkers
+        Pool holding the Hamiltonian and the samples.
+    n_samples : int
+        Number of samples used to stochastically estimate the KL.
+    constants : list
+        Keys of the position which are kept constant.
+    point_estimates : list
+        Keys of the position for which no samples are drawn.
+    '''
+
+    _tokens = 0
+
+    def __init__(self, mean, workers, n_samples, constants=[],
+                 point_estimates=[], _generation=None):
+        super(ParallelMetricGaussianKL, self).__init__(mean)
+        if _generation is None:
+            _generation = workers.draw(mean, n_samples, point_estimates)
+        self._workers = workers
+        self._n_samples = n_samples
+        self._constants = constants
+        self._point_estimates = point_estimates
+        self._generation = _generation
+        ParallelMetricGaussianKL._tokens += 1
+        self._token = ParallelMetricGaussianKL._tokens
+        self._check_generation()
+        self._values, g = workers.energy(mean, constants)
+        self._val = self._values.sum()/n_samples
+        self._grad = g*(1./n_samples)
+        self._samples = None
+
+    def _check_generation(self):
+        if self._generation != self._workers.generation:
+            raise RuntimeError('samples of this KL have been replaced')
+
+    @property
+    def workers(self):
+        return self._workers
+
+    @property
+    def n_samples(self):
+        return self._n_samples
+
+    @property
+    def sample_values(self):
+        '''Hamiltonian at the position shifted by each of the samples.'''
+        return self._values
+
+    def at(self, position):
+        return ParallelMetricGaussianKL(
+            position, self._workers, self._n_samples, self._constants,
+            self._point_estimates, _generation=self._generation)
+
+    @property
+    def value(self):
+        return self._val
+
+    @property
+    def gradient(self):
+        return self._grad
+
+    def apply_metric(self, x):
+        self._check_generation()
+        res = self._workers.apply_metric(self._token, self._position,
+                                         self._constants, x)
+        return res*(1./self._n_samples)
+
+    @property
+    def metric(self):
+        return _ParallelKLMetric(self)
+
+    @property
+    def samples(self):
+        if self._samples is None:
+            self._check_generation()
+            self._samples = self._workers.samples()
+        return self._samples
+
+    def iter_samples(self):
+        '''Like `samples`, but fetches the samples one by one from the
+        workers unless they are held already.'''
+        if self._samples is not None:
+            return iter(self._samples)
+        self._check_generation()
+        return self._workers.iter_samples()
+
+    def __repr__(self):
+        return 'ParallelMetricGaussianKL ({} samples, {} workers)'.format(
+            self._n_samples, self._workers.n_workers)
@@ -15,35 +15,91 @@
 #
 # NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
 
+import functools
+import os
 from itertools import product
 
 import numpy as np
-import pylab as plt
-from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 import nifty5 as ift
 
+from .posterior import PosteriorSummary
+from .prior import PriorPredictive
+from .render import ImagePyramid, display_image, render
 
+# The plotting stack is imported by the first plot, not with the package
+plt, make_axes_locatable = None, None
+_headless = [
+    os.environ.get('NIFTY_TUTORIAL_HEADLESS', '0') not in ('', '0')
+]
+
+
+def set_headless(headless=True):
+    '''In headless mode, all plot functions of the helpers return
+    immediately and matplotlib is never imported. The default is taken from
+    the environment variable `NIFTY_TUTORIAL_HEADLESS`.'''
+    _headless[0] = bool(headless)
+
+
+def is_headless():
+    return _headless[0]
+
+
+def _plotting(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _headless[0]:
+            return None
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def _rendering(func):
+    # Renderers take numpy arrays only and may run in a background process
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        global plt, make_axes_locatable
+        if plt is None:
+            import pylab
+            from mpl_toolkits.axes_grid1 import make_axes_locatable as mal
+            plt, make_axes_locatable = pylab, mal
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+@_plotting
 def plot_WF(name, mock, d, m=None, samples=None):
-    plt.figure(figsize=(15, 8))
     dist = mock.domain[0].distances[0]
     npoints = mock.domain[0].shape[0]
     xcoord = np.arange(npoints, dtype=np.float64)*dist
-    plt.plot(xcoord, d.to_global_data(), 'kx', label='data')
-    plt.plot(xcoord, mock.to_global_data(), 'b-', label='ground truth')
+    md, std = None, None
     if m is not None:
-        plt.plot(xcoord, m.to_global_data(), 'k-', label='reconstruction')
+        md = m.to_global_data()
+    if samples is not None:
+        # samples may also be a batch of shape (n_samples, npoints)
+        sc = PosteriorSummary(quantiles=None)
+        for s in samples:
+            if isinstance(s, ift.Field):
+                s = s.to_global_data()
+            sc.add(s - md)
+        std = np.sqrt(sc.second_moment)
+    render(_render_WF, name, xcoord, d.to_global_data(),
+           mock.to_global_data(), md, std)
+
+
+@_rendering
+def _render_WF(name, xcoord, d, mock, md, std):
+    plt.figure(figsize=(15, 8))
+    plt.plot(xcoord, d, 'kx', label='data')
+    plt.plot(xcoord, mock, 'b-', label='ground truth')
+    if md is not None:
+        plt.plot(xcoord, md, 'k-', label='reconstruction')
     plt.title('reconstructed signal')
     plt.ylabel('value')
     plt.xlabel('position')
-    if samples is not None:
-        std = 0
-        for s in samples:
-            std = std + (s - m)**2
-        std = std/len(samples)
-        std = std.to_global_data()
-        std = np.sqrt(std)
-        md = m.to_global_data()
+    if std is not None:
         plt.fill_between(
             xcoord,
             md - std,
@@ -52,9 +108,8 @@ def plot_WF(name, mock, d, m=None, samples=None):
             color='k',
             label='standard deviation')
     plt.legend()
-    x1, x2, y1, y2 = plt.axis()
-    ymin = np.min(d.to_global_data()) - 0.1
-    ymax = np.max(d.to_global_data()) + 0.1
+    ymin = np.min(d) - 0.1
+    ymax = np.max(d) + 0.1
     xmin = np.min(xcoord)
     xmax = np.max(xcoord)
     plt.axis((xmin, xmax, ymin, ymax))
@@ -62,13 +117,21 @@ def plot_WF(name, mock, d, m=None, samples=None):
     plt.close('all')
 
 
+@_plotting
 def power_plot(name, s, m, samples=None):
+    if samples is not None:
+        samples = [sample.to_global_data() for sample in samples]
+    render(_render_power, name, s.domain[0].k_lengths, s.to_global_data(),
+           m.to_global_data(), samples)
+
+
+@_rendering
+def _render_power(name, ks, s, m, samples):
     plt.figure(figsize=(15, 8))
-    ks = s.domain[0].k_lengths
     plt.xscale('log')
     plt.yscale('log')
-    plt.plot(ks, s.to_global_data(), 'b-', label='ground truth')
-    plt.plot(ks, m.to_global_data(), 'k-', label='reconstruction')
+    plt.plot(ks, s, 'b-', label='ground truth')
+    plt.plot(ks, m, 'k-', label='reconstruction')
     plt.title('reconstructed power-spectrum')
     plt.ylabel('power')
     plt.xlabel('harmonic mode')
@@ -78,69 +141,53 @@ def power_plot(name, s, m, samples=None):
                 lgd = 'samples'
             else:
                 lgd = None
-            plt.plot(
-                ks, samples[i].to_global_data(), 'k-', alpha=0.3, label=lgd)
+            plt.plot(ks, samples[i], 'k-', alpha=0.3, label=lgd)
     plt.legend()
     plt.savefig('{}.png'.format(name), dpi=300)
     plt.close('all')
 
 
+@_plotting
 def plot_prior_samples_2d(n_samps,
                           signal,
                           R,
                           correlated_field,
                           A,
                           likelihood,
-                          N=None):
-    samples, pspecmin, pspecmax = [], np.inf, 0
-    pspec = A*A
-    for _ in range(n_samps):
-        ss = ift.from_random('normal', signal.domain)
-        samples.append(ss)
-        foo = pspec.force(ss).to_global_data()
-        pspecmin = min([min(foo), pspecmin])
-        pspecmax = max([max(foo), pspecmin])
+                          N=None,
+                          seed=None):
+    res = PriorPredictive(signal, R, correlated_field, A, likelihood,
+                          N).sample(n_samps, seed)
+    for key in ('correlated_field', 'signal', 'response', 'data'):
+        res[key] = [display_image(img) for img in res[key]]
+    render(_render_prior_samples, n_samps, likelihood, res)
+
+
+@_rendering
+def _render_prior_samples(n_samps, likelihood, res):
+    pspecmin, pspecmax = res['power'].min(), res['power'].max()
 
     fig, ax = plt.subplots(nrows=n_samps, ncols=5, figsize=(2*5, 2*n_samps))
-    for ii, sample in enumerate(samples):
-        cf = correlated_field(sample)
-        signal_response = R @ signal
-        sg = signal(sample)
-        sr = (R.adjoint @ R @ signal)(sample)
-        if likelihood == 'gauss':
-            data = signal_response(sample) + N.draw_sample()
-        elif likelihood == 'poisson':
-            rate = signal_response(sample).to_global_data()
-            data = ift.from_global_data(signal_response.target,
-                                        np.random.poisson(rate))
-        elif likelihood == 'bernoulli':
-            rate = signal_response(sample).to_global_data()
-            data = ift.from_global_data(signal_response.target,
-                                        np.random.binomial(1, rate))
-        else:
-            raise ValueError('likelihood type not implemented')
-        data = R.adjoint(data + 0.)
-
-        As = pspec.force(sample)
-        ax[ii, 0].plot(As.domain[0].k_lengths, As.to_global_data())
+    for ii in range(n_samps):
+        ax[ii, 0].plot(res['k'], res['power'][ii])
         ax[ii, 0].set_ylim(pspecmin, pspecmax)
         ax[ii, 0].set_yscale('log')
         ax[ii, 0].set_xscale('log')
         ax[ii, 0].get_xaxis().set_visible(False)
 
-        ax[ii, 1].imshow(cf.to_global_data(), aspect='auto')
+        ax[ii, 1].imshow(res['correlated_field'][ii], aspect='auto')
         ax[ii, 1].get_xaxis().set_visible(False)
         ax[ii, 1].get_yaxis().set_visible(False)
 
-        ax[ii, 2].imshow(sg.to_global_data(), aspect='auto')
+        ax[ii, 2].imshow(res['signal'][ii], aspect='auto')
         ax[ii, 2].get_xaxis().set_visible(False)
         ax[ii, 2].get_yaxis().set_visible(False)
 
-        ax[ii, 3].imshow(sr.to_global_data(), aspect='auto')
+        ax[ii, 3].imshow(res['response'][ii], aspect='auto')
         ax[ii, 3].get_xaxis().set_visible(False)
         ax[ii, 3].get_yaxis().set_visible(False)
 
-        ax[ii, 4].imshow(data.to_global_data(), cmap='viridis', aspect='auto')
+        ax[ii, 4].imshow(res['data'][ii], cmap='viridis', aspect='auto')
         ax[ii, 4].get_xaxis().set_visible(False)
         ax[ii, 4].yaxis.tick_right()
         ax[ii, 4].get_yaxis().set_visible(False)
@@ -158,52 +205,85 @@ def plot_prior_samples_2d(n_samps,
     plt.close('all')
 
 
-def plot_reconstruction_2d(data, ground_truth, KL, signal, R, A, name):
-    sc = ift.StatCalculator()
-    sky_samples, pspec_samples = [], []
-    for sample in KL.samples:
-        tmp = signal(sample + KL.position)
-        sc.add(tmp)
-        sky_samples.append(tmp)
-        pspec_samples.append(A.force(sample)**2)
+def _iter_samples(KL):
+    # ParallelMetricGaussianKL and PosteriorResult hand out the samples one
+    # by one, ift.MetricGaussianKL only as a tuple
+    it = getattr(KL, 'iter_samples', None)
+    return iter(KL.samples) if it is None else it()
+
+
+@_plotting
+def plot_reconstruction_2d(data, ground_truth, KL, signal, R, A, name,
+                           pspec_bands=False):
+    '''Reconstruction of a 2D signal. The power spectra of the samples are
+    drawn as lines, or with `pspec_bands` as their range and central 68%
+    band, which stays readable for many samples.'''
+    sc = PosteriorSummary(quantiles=None)
+    pspec_sc = PosteriorSummary() if pspec_bands else PosteriorSummary(
+        quantiles=None)
+    pspec_samples = []
+    for sample in _iter_samples(KL):
+        sc.add(signal(sample + KL.position))
+        pspec = A.force(sample)**2
+        pspec_sc.add(pspec)
+        if not pspec_bands:
+            pspec_samples.append(pspec.to_global_data())
 
+    truth = ImagePyramid(signal(ground_truth).to_global_data())
+    images = [
+        truth.image(),
+        display_image(R.adjoint(R(sc.mean)).to_global_data()),
+        display_image(R.adjoint(data).to_global_data()),
+        display_image(sc.mean.to_global_data()),
+        display_image(ift.sqrt(sc.var).to_global_data())
+    ]
+    spectra = {
+        'k': pspec_sc.mean.domain[0].k_lengths,
+        'mean': pspec_sc.mean.to_global_data(),
+        'samples': pspec_samples,
+        'truth': A.force(ground_truth).to_global_data()**2
+    }
+    if pspec_bands:
+        lo, _, hi = pspec_sc.quantile()
+        spectra.update(min=pspec_sc.min.to_global_data(),
+                       max=pspec_sc.max.to_global_data(),
+                       lo=lo.to_global_data(), hi=hi.to_global_data())
+    render(_render_reconstruction, name, images, truth.vmin, truth.vmax,
+           spectra)
+
+
+@_rendering
+def _render_reconstruction(name, images, vmin, vmax, spectra):
     fig, ax = plt.subplots(nrows=2, ncols=3, figsize=(4*3, 4*2))
     im = []
-    foo = signal(ground_truth).to_global_data()
-    vmin, vmax = np.min(foo), np.max(foo)
-    im.append(ax[0, 0].imshow(foo, aspect='auto', vmin=vmin, vmax=vmax))
+    im.append(ax[0, 0].imshow(
+        images[0], aspect='auto', vmin=vmin, vmax=vmax))
     ax[0, 0].set_title('true signal')
 
-    im.append(ax[0, 1].imshow(
-        R.adjoint(R(sc.mean)).to_global_data(), aspect='auto'))
+    im.append(ax[0, 1].imshow(images[1], aspect='auto'))
     ax[0, 1].set_title('signal response')
 
-    im.append(ax[0, 2].imshow(R.adjoint(data).to_global_data(), aspect='auto'))
+    im.append(ax[0, 2].imshow(images[2], aspect='auto'))
     ax[0, 2].set_title('data')
 
     im.append(ax[1, 0].imshow(
-        sc.mean.to_global_data(), aspect='auto', vmin=vmin, vmax=vmax))
+        images[3], aspect='auto', vmin=vmin, vmax=vmax))
     ax[1, 0].set_title('posterior mean')
 
-    im.append(ax[1, 1].imshow(
-        ift.sqrt(sc.var).to_global_data(), aspect='auto'))
+    im.append(ax[1, 1].imshow(images[4], aspect='auto'))
     ax[1, 1].set_title('standard deviation')
 
-    for ss in pspec_samples:
-        ax[1, 2].plot(
-            ss.domain[0].k_lengths, ss.to_global_data(), color='lightgrey')
-
-    amp_mean = sum(pspec_samples)/len(pspec_samples)
-    ax[1, 2].plot(
-        amp_mean.domain[0].k_lengths,
-        amp_mean.to_global_data(),
-        color='black',
-        label='reconstruction')
-    ax[1, 2].plot(
-        amp_mean.domain[0].k_lengths,
-        A.force(ground_truth).to_global_data()**2,
-        color='b',
-        label='ground truth')
+    ks = spectra['k']
+    for ss in spectra['samples']:
+        ax[1, 2].plot(ks, ss, color='lightgrey')
+    if 'lo' in spectra:
+        ax[1, 2].fill_between(
+            ks, spectra['min'], spectra['max'], color='lightgrey',
+            label='samples')
+        ax[1, 2].fill_between(ks, spectra['lo'], spectra['hi'],
+                              color='darkgrey')
+    ax[1, 2].plot(ks, spectra['mean'], color='black', label='reconstruction')
+    ax[1, 2].plot(ks, spectra['truth'], color='b', label='ground truth')
     ax[1, 2].legend()
     ax[1, 2].set_yscale('log')
     ax[1, 2].set_xscale('log')
@@ -222,3 +302,34 @@ def plot_reconstruction_2d(data, ground_truth, KL, signal, R, A, name):
     plt.tight_layout()
     plt.savefig('reconstruction{}.png'.format(name))
     plt.close('all')
+
+
+@_plotting
+def plot_telemetry(records, name):
+    '''Convergence of energy and gradient versus wall time from the records
+    of a TelemetryStream.'''
+    render(_render_telemetry, records, name)
+
+
+@_rendering
+def _render_telemetry(records, name):
+    fig, ax = plt.subplots(nrows=2, ncols=1, figsize=(10, 8), sharex=True)
+    runs = sorted(set(r['run'] for r in records))
+    for run in runs:
+        rec = [r for r in records if r['run'] == run]
+        t = np.array([r['time'] for r in rec])
+        t = t - t[0]
+        ax[0].plot(t, [r['energy'] for r in rec], '.-', label=run)
+        ax[1].plot(t, [r['gradient_inf_norm'] for r in rec], '.-', label=run)
+        outer = np.array([r['outer'] for r in rec])
+        for tt in t[1:][outer[1:] != outer[:-1]]:
+            ax[0].axvline(tt, color='lightgrey')
+            ax[1].axvline(tt, color='lightgrey')
+    ax[0].set_ylabel('energy')
+    ax[1].set_ylabel('gradient inf-norm')
+    ax[1].set_yscale('log')
+    ax[1].set_xlabel('wall time [s]')
+    ax[0].legend()
+    plt.tight_layout()
+    plt.savefig('{}.png'.format(name), dpi=300)
+    plt.close('all')
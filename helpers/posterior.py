@@ -0,0 +1,133 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+
+class PosteriorSummary(object):
+    '''Single-pass summary statistics of a stream of samples.
+
+    Mean and variance are accumulated with Welford's algorithm, minimum and
+    maximum pixelwise. Quantiles are estimated from a reservoir of at most
+    `n_sketch` samples, so memory does not grow with the number of samples
+    added; with up to `n_sketch` samples they are exact. The reservoir grows
+    with the samples added, up to `n_sketch`.
+
+    Parameters
+    ----------
+    quantiles : tuple of float or None
+        Quantiles returned by `quantile`. With None, no reservoir is kept
+        and only the moments, minimum and maximum are available.
+    n_sketch : int
+        Size of the reservoir used for the quantiles.
+    seed : int
+        Seed for the reservoir replacement, which is independent of the
+        global random state.
+    '''
+
+    def __init__(self, quantiles=(0.16, 0.5, 0.84), n_sketch=64, seed=0):
+        self._q = None if quantiles is None else tuple(quantiles)
+        self._n_sketch = int(n_sketch)
+        self._rng = np.random.default_rng(seed)
+        self._domain = None
+        self._n = 0
+        self._reservoir = []
+
+    def add(self, sample):
+        if isinstance(sample, ift.Field):
+            self._domain = sample.domain
+            sample = sample.to_global_data()
+        x = np.asarray(sample, dtype=np.float64)
+        self._n += 1
+        if self._n == 1:
+            self._mean = x.copy()
+            self._m2 = np.zeros_like(x)
+            self._min, self._max = x.copy(), x.copy()
+        else:
+            delta = x - self._mean
+            self._mean += delta/self._n
+            self._m2 += delta*(x - self._mean)
+            np.minimum(self._min, x, out=self._min)
+            np.maximum(self._max, x, out=self._max)
+        if self._q is None:
+            return
+        if self._n <= self._n_sketch:
+            self._reservoir.append(x.copy())
+        else:
+            j = self._rng.integers(self._n)
+            if j < self._n_sketch:
+                self._reservoir[j] = x
+
+    def _out(self, arr):
+        if self._domain is None:
+            return arr
+        return ift.from_global_data(self._domain, arr)
+
+    def _check(self, n_min=1):
+        if self._n < n_min:
+            raise ValueError('at least {} samples needed'.format(n_min))
+
+    @property
+    def n_samples(self):
+        return self._n
+
+    @property
+    def mean(self):
+        self._check()
+        return self._out(self._mean.copy())
+
+    @property
+    def var(self):
+        '''Unbiased sample variance, as computed by `ift.StatCalculator`.'''
+        self._check(2)
+        return self._out(self._m2/(self._n - 1))
+
+    @property
+    def second_moment(self):
+        '''Mean of the squared samples.'''
+        self._check()
+        return self._out(self._m2/self._n + self._mean**2)
+
+    @property
+    def min(self):
+        self._check()
+        return self._out(self._min.copy())
+
+    @property
+    def max(self):
+        self._check()
+        return self._out(self._max.copy())
+
+    def quantile(self, q=None):
+        '''Returns a list with one estimate per requested quantile.'''
+        self._check()
+        if self._q is None:
+            raise ValueError('summary was created without quantiles')
+        q = self._q if q is None else tuple(q)
+        res = np.stack(self._reservoir)
+        return [self._out(v) for v in np.quantile(res, q, axis=0)]
+
+
+def summarize_samples(samples, **kwargs):
+    '''Consumes an iterable of samples in one pass and returns their
+    `PosteriorSummary`.'''
+    sc = PosteriorSummary(**kwargs)
+    for s in samples:
+        sc.add(s)
+    return sc
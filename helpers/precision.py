@@ -0,0 +1,87 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import os
+
+import numpy as np
+
+import nifty5 as ift
+
+_precision = [np.dtype(os.environ.get('NIFTY_TUTORIAL_STORAGE_PRECISION',
+                                     'float64'))]
+
+
+def set_storage_precision(dtype):
+    '''Sets the precision ('float32' or 'float64') in which Gaussian data
+    and KL samples are stored.
+
+    This is not a single-precision mode of the computation. Only two kinds
+    of arrays are affected: the Gaussian data (also in
+    `generate_data_batch`) and the KL samples in every SampleWorkers
+    process. They are held throughout a reconstruction, and float32 halves
+    their memory. Everything else stays in float64: the correlated field
+    model, the likelihoods, the minimizer positions and the vectors of the
+    conjugate gradients. NIFTy's operators keep their own arrays in double
+    precision, so every evaluation promotes its input to float64 and
+    accumulates in float64. The saving therefore scales with the number of
+    samples and data sets held. The default is taken from the environment
+    variable `NIFTY_TUTORIAL_STORAGE_PRECISION`.
+    '''
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError('precision must be float32 or float64')
+    _precision[0] = dtype
+
+
+def get_storage_precision():
+    return _precision[0]
+
+
+def cast(field, dtype=None):
+    '''Returns a copy of a Field or MultiField with floating-point values in
+    the storage precision (or `dtype`).'''
+    dtype = get_storage_precision() if dtype is None else np.dtype(dtype)
+    if isinstance(field, ift.MultiField):
+        return ift.MultiField(field.domain,
+                              tuple(cast(v, dtype) for v in field.values()))
+    # the local slab suffices, with MPI this avoids gathering the field
+    arr = field.local_data
+    if not np.issubdtype(arr.dtype, np.floating) or arr.dtype == dtype:
+        return field
+    return ift.from_local_data(field.domain, arr.astype(dtype))
+
+
+def compare_reconstructions(reference, candidate, rtol=1e-3):
+    '''Compares a reconstruction (e.g. with float32 storage) with a
+    reference (float64) one.
+
+    Both arguments are dicts of Fields or arrays with the same keys, for
+    example `{'mean': ..., 'std': ...}`. For every key the relative L2
+    deviation `|candidate - reference|/|reference|` is computed. Returns
+    the deviations and whether all of them are below `rtol`.
+    '''
+    res = {}
+    for key, ref in reference.items():
+        cand = candidate[key]
+        if isinstance(ref, ift.Field):
+            ref = ref.to_global_data()
+        if isinstance(cand, ift.Field):
+            cand = cand.to_global_data()
+        ref = np.asarray(ref, np.float64)
+        cand = np.asarray(cand, np.float64)
+        res[key] = np.linalg.norm(cand - ref)/max(np.linalg.norm(ref), 1e-300)
+    return res, all(v < rtol for v in res.values())
@@ -0,0 +1,185 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .telemetry import CountingController
+
+
+class HarmonicPreconditioner(object):
+    '''Harmonic-space diagonal approximation of the metric of a correlated
+    field model.
+
+    With the excitations `xi` of `CorrelatedField(target, amplitude)`, the
+    metric of the standardized Hamiltonian is `1 + J^dagger N^-1 J`, where
+    the Jacobian with respect to `xi` is the harmonic transform times the
+    amplitude. If the response and the noise (or, for Poisson and Bernoulli
+    likelihoods, the Fisher metric) are roughly homogeneous, this is
+    approximately diagonal in harmonic space:
+
+        M_xi ~ 1 + c*A(k)**2
+
+    The spectrum `A(k)**2` is evaluated at the current position. The
+    averaged noise and exposure level `c` is measured with one application
+    of the actual metric to a random probe, which also absorbs the
+    normalization of the harmonic transform. All other keys of the position
+    (the amplitude parameters) get the prior metric 1.
+
+    Parameters
+    ----------
+    amplitude : Operator
+        Amplitude model of the correlated field.
+    key : str
+        Key of the excitations of the correlated field.
+    seed : int
+        Seed of the probe. `np.random` is not touched.
+    '''
+
+    def __init__(self, amplitude, key='xi', seed=0):
+        self._amplitude = amplitude
+        self._key = key
+        self._seed = seed
+
+    def diagonal(self, position, metric):
+        '''The diagonal of the approximate metric as a MultiField on the
+        domain of `metric`.'''
+        dom = metric.domain
+        h_space = dom[self._key][0]
+        pd = ift.PowerDistributor(h_space, self._amplitude.target[0])
+        pspec = pd(self._amplitude.force(position)**2).to_global_data()
+
+        rng = np.random.RandomState(self._seed)
+        probe = {k: np.zeros(dom[k].shape) for k in dom.keys()}
+        probe[self._key] = rng.standard_normal(h_space.shape)
+        x = ift.MultiField.from_global_data(dom, probe)
+        mx = metric(x).to_global_data()[self._key]
+        xi = probe[self._key]
+        c = max(np.vdot(xi, mx - xi)/max(np.vdot(xi, pspec*xi), 1e-300), 0.)
+
+        diag = {k: np.ones(dom[k].shape) for k in dom.keys()}
+        diag[self._key] = 1. + c*pspec
+        return ift.MultiField.from_global_data(dom, diag)
+
+    def approximation(self, position, metric):
+        '''Diagonal operator approximating `metric`; its inverse is the
+        preconditioner.'''
+        return ift.makeOp(self.diagonal(position, metric))
+
+
+class SamplingHamiltonian(ift.StandardHamiltonian):
+    '''StandardHamiltonian whose samples are drawn with a conjugate gradient
+    preconditioned by `preconditioner.approximation(position, metric)`.
+
+    Like in StandardHamiltonian, the metric is a SamplingEnabler of the
+    likelihood and the prior metric; only its approximation differs. The
+    iterations of the sampling conjugate gradient are accumulated in
+    `sampling_iterations`.
+
+    Parameters
+    ----------
+    lh : EnergyOperator
+        The likelihood energy.
+    ic_samp : IterationController, optional
+        Controller of the sampling conjugate gradient.
+    preconditioner : HarmonicPreconditioner, optional
+        Without, the prior metric approximates the metric, as in
+        StandardHamiltonian.
+    '''
+
+    def __init__(self, lh, ic_samp=None, preconditioner=None):
+        super(SamplingHamiltonian, self).__init__(lh, ic_samp)
+        self._likelihood = lh
+        self._prior_energy = ift.GaussianEnergy(domain=lh.domain)
+        self._sampling_ic = None
+        if ic_samp is not None:
+            self._sampling_ic = CountingController(ic_samp)
+        self._preconditioner = preconditioner
+
+    @property
+    def sampling_iterations(self):
+        '''Sampling CG iterations done so far in this process.'''
+        return 0 if self._sampling_ic is None else self._sampling_ic.count
+
+    def apply(self, x):
+        if (self._sampling_ic is None or not isinstance(x, ift.Linearization)
+                or not x.want_metric):
+            return super(SamplingHamiltonian, self).apply(x)
+        self._check_input(x)
+        lhx, prx = self._likelihood(x), self._prior_energy(x)
+        approximation = prx.metric.inverse
+        if self._preconditioner is not None:
+            approximation = self._preconditioner.approximation(
+                x.val, lhx.metric + prx.metric)
+        met = ift.SamplingEnabler(lhx.metric, prx.metric.inverse,
+                                  self._sampling_ic, approximation)
+        return (lhx + prx).add_metric(met)
+
+
+class PreconditionedNewtonCG(ift.NewtonCG):
+    '''NewtonCG whose inner conjugate gradient is preconditioned with the
+    inverse of `preconditioner.approximation(position, metric)`.
+
+    The inner solve stops like the one of NIFTy's NewtonCG. The number of
+    inner CG iterations is accumulated in `cg_iterations`.
+
+    Parameters
+    ----------
+    controller : IterationController
+        Controller of the Newton iterations.
+    preconditioner : HarmonicPreconditioner, optional
+        Without, the inner solve is unpreconditioned.
+    nreset, max_cg_iterations, energy_reduction_factor, line_searcher, name
+        As for NewtonCG.
+    '''
+
+    def __init__(self, controller, preconditioner=None, line_searcher=None,
+                 name=None, nreset=20, max_cg_iterations=200,
+                 energy_reduction_factor=0.1):
+        super(PreconditionedNewtonCG, self).__init__(
+            controller, line_searcher=line_searcher, name=name,
+            nreset=nreset, max_cg_iterations=max_cg_iterations,
+            energy_reduction_factor=energy_reduction_factor)
+        self._preconditioner = preconditioner
+        self._cg_settings = (name, nreset, max_cg_iterations,
+                             energy_reduction_factor)
+        self.cg_iterations = 0
+
+    def preconditioner(self, energy):
+        '''Preconditioner of the inner conjugate gradient at `energy`, or
+        None.'''
+        if self._preconditioner is None:
+            return None
+        return self._preconditioner.approximation(energy.position,
+                                                  energy.metric).inverse
+
+    def get_descent_direction(self, energy, old_value=None):
+        name, nreset, max_iterations, reduction = self._cg_settings
+        if old_value is None:
+            ic = ift.GradientNormController(iteration_limit=5)
+        else:
+            ediff = reduction*(old_value - energy.value)
+            ic = ift.AbsDeltaEnergyController(
+                ediff, iteration_limit=max_iterations, name=name)
+        ic = CountingController(ic)
+        e = ift.QuadraticEnergy(0*energy.position, energy.metric,
+                                energy.gradient)
+        e, _ = ift.ConjugateGradient(ic, nreset=nreset)(
+            e, self.preconditioner(energy))
+        self.cg_iterations += ic.count
+        return -e.position
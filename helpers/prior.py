@@ -0,0 +1,146 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+import nifty5 as ift
+
+from .distributed import rank_seed
+
+_engine = None
+
+
+def _head(op, inner):
+    '''Returns the operators which `op` applies to the output of `inner`
+    (innermost last), or None if `op` is not of the form `head(inner)`.'''
+    if op is inner:
+        return ()
+    ops = getattr(op, '_ops', None)
+    inner_ops = getattr(inner, '_ops', (inner,))
+    if ops is None or len(ops) <= len(inner_ops):
+        return None
+    if all(a is b for a, b in zip(ops[-len(inner_ops):], inner_ops)):
+        return tuple(ops[:-len(inner_ops)])
+    return None
+
+
+class PriorPredictive(object):
+    '''Draws prior samples and evaluates everything derived from them in one
+    forward pass per sample.
+
+    For every sample, the power spectrum `A**2`, the correlated field, the
+    signal, the signal response and synthetic data are computed. The signal
+    is obtained from the already computed correlated field if it is a
+    function of it (e.g. `correlated_field.sigmoid()`), and the response
+    from the already computed signal.
+
+    Parameters
+    ----------
+    signal, correlated_field, A : Operator
+        Signal, correlated field and amplitude model on the same domain.
+    R : LinearOperator
+        Response, applied to the signal.
+    likelihood : str
+        'gauss', 'poisson' or 'bernoulli'.
+    N : EndomorphicOperator, optional
+        Noise covariance for 'gauss'.
+    '''
+
+    def __init__(self, signal, R, correlated_field, A, likelihood, N=None):
+        if likelihood not in ('gauss', 'poisson', 'bernoulli'):
+            raise ValueError('likelihood type not implemented')
+        self._signal, self._R, self._A = signal, R, A
+        self._cf = correlated_field
+        self._likelihood, self._N = likelihood, N
+        self._head = _head(signal, correlated_field)
+
+    def evaluate(self, seed):
+        '''Arrays of the quantities derived from the prior sample drawn with
+        `seed`. The state of `np.random` is restored afterwards.'''
+        # NIFTy draws from the global np.random
+        state = np.random.get_state()
+        try:
+            np.random.seed(rank_seed(seed))
+            return self._evaluate()
+        finally:
+            np.random.set_state(state)
+
+    def _evaluate(self):
+        ss = ift.from_random('normal', self._signal.domain)
+        cf = self._cf(ss.extract(self._cf.domain))
+        if self._head is None:
+            sg = self._signal(ss)
+        else:
+            sg = cf
+            for op in reversed(self._head):
+                sg = op(sg)
+        sr = self._R(sg)
+        if self._likelihood == 'gauss':
+            data = sr + self._N.draw_sample()
+        elif self._likelihood == 'poisson':
+            data = ift.from_global_data(
+                sr.domain, np.random.poisson(sr.to_global_data()))
+        else:
+            data = ift.from_global_data(
+                sr.domain, np.random.binomial(1, sr.to_global_data()))
+        return {
+            'power': (self._A.force(ss)**2).to_global_data(),
+            'correlated_field': cf.to_global_data(),
+            'signal': sg.to_global_data(),
+            'response': self._R.adjoint(sr).to_global_data(),
+            'data': self._R.adjoint(data + 0.).to_global_data()
+        }
+
+    def sample(self, n_samples, seed=None, n_workers=None):
+        '''Evaluates `n_samples` prior samples, in `n_workers` forked
+        processes (default: `NIFTY_TUTORIAL_WORKERS`, or 1).
+
+        Every sample has its own seed spawned from `seed`, so the result does
+        not depend on the number of workers. Without `seed`, it is drawn
+        from `np.random`, so that the samples follow the seed of the script.
+        Apart from that draw, the state of `np.random` is not changed.
+        Returns a dict of arrays with the samples along the first axis, and
+        the k-lengths of the power spectrum under 'k'.
+        '''
+        global _engine
+        if seed is None:
+            seed = np.random.randint(2**31)
+        if n_workers is None:
+            n_workers = int(os.environ.get('NIFTY_TUTORIAL_WORKERS', 1))
+        seeds = [
+            s.generate_state(1)[0]
+            for s in np.random.SeedSequence(seed).spawn(n_samples)
+        ]
+        if n_workers <= 1:
+            res = [self.evaluate(s) for s in seeds]
+        else:
+            _engine = self
+            try:
+                with mp.get_context('fork').Pool(n_workers) as pool:
+                    res = pool.map(_evaluate, seeds)
+            finally:
+                _engine = None
+        out = {key: np.stack([r[key] for r in res]) for key in res[0]}
+        out['k'] = self._A.target[0].k_lengths
+        return out
+
+
+def _evaluate(seed):
+    return _engine.evaluate(seed)
@@ -0,0 +1,186 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import atexit
+import functools
+import json
+import os
+from time import perf_counter
+
+import nifty5 as ift
+
+_MODES = {1: 'apply', 2: 'adjoint', 4: 'inverse', 8: 'adjoint_inverse'}
+
+
+def _subclasses(cls):
+    res, todo = [], [cls]
+    while todo:
+        c = todo.pop()
+        res.append(c)
+        todo.extend(c.__subclasses__())
+    return res
+
+
+def _nbytes(x):
+    if isinstance(x, ift.Linearization):
+        return _nbytes(x.val)
+    if isinstance(x, ift.MultiField):
+        return sum(_nbytes(v) for v in x.values())
+    if isinstance(x, ift.Field):
+        return x.local_data.nbytes
+    return 0
+
+
+def _kind(args, kwargs):
+    if len(args) > 1:
+        return _MODES.get(args[1], 'apply')
+    if 'mode' in kwargs:
+        return _MODES.get(kwargs['mode'], 'apply')
+    if len(args) > 0 and isinstance(args[0], ift.Linearization):
+        return 'jacobian'
+    return 'apply'
+
+
+class OperatorProfiler(object):
+    '''Records calls, wall time and output size of every operator.
+
+    `enable` replaces the `apply` method of every subclass of `ift.Operator`
+    and the `__call__` method of every `ift.Minimizer` by a timing wrapper,
+    `disable` restores them. Nothing is changed before `enable`, so the
+    profiler costs nothing when it is not used.
+
+    Per operator class, the number of calls (split into apply, adjoint,
+    inverse and jacobian), the inclusive and exclusive wall time and the
+    bytes of the returned fields are recorded. Exclusive times are also
+    collected per call stack and written in the folded format of
+    flamegraph.pl and speedscope.
+    '''
+
+    def __init__(self):
+        self._stats = {}
+        self._folded = {}
+        self._stack = []
+        # operators whose call is being timed, see _wrap
+        self._active = set()
+        self._patched = []
+
+    @property
+    def enabled(self):
+        return len(self._patched) > 0
+
+    def _wrap(self, cls, attr):
+        func = cls.__dict__[attr]
+        stats, folded, stack = self._stats, self._folded, self._stack
+        active = self._active
+
+        @functools.wraps(func)
+        def wrapper(obj, *args, **kwargs):
+            # an overridden apply which calls super().apply would otherwise
+            # be counted once per class in its hierarchy
+            if id(obj) in active:
+                return func(obj, *args, **kwargs)
+            active.add(id(obj))
+            name = type(obj).__name__
+            kind = 'minimize' if attr == '__call__' else _kind(args, kwargs)
+            frame = [name, 0.]
+            stack.append(frame)
+            t0 = perf_counter()
+            try:
+                res = func(obj, *args, **kwargs)
+            finally:
+                dt = perf_counter() - t0
+                active.discard(id(obj))
+                stack.pop()
+                if stack:
+                    stack[-1][1] += dt
+                key = ';'.join([f[0] for f in stack] + [name])
+                folded[key] = folded.get(key, 0.) + dt - frame[1]
+                st = stats.setdefault(name, {'time': 0., 'self_time': 0.,
+                                             'bytes': 0})
+                st[kind] = st.get(kind, 0) + 1
+                st['time'] += dt
+                st['self_time'] += dt - frame[1]
+            st['bytes'] += _nbytes(res[0] if isinstance(res, tuple) else res)
+            return res
+
+        setattr(cls, attr, wrapper)
+        self._patched.append((cls, attr, func))
+
+    def enable(self):
+        if self.enabled:
+            return
+        for cls in _subclasses(ift.Operator):
+            if 'apply' in cls.__dict__:
+                self._wrap(cls, 'apply')
+        for cls in _subclasses(ift.Minimizer):
+            if '__call__' in cls.__dict__:
+                self._wrap(cls, '__call__')
+
+    def disable(self):
+        for cls, attr, func in self._patched:
+            setattr(cls, attr, func)
+        self._patched = []
+
+    def reset(self):
+        self._stats.clear()
+        self._folded.clear()
+
+    def summary(self):
+        '''Statistics per operator class, sorted by exclusive time.'''
+        return dict(
+            sorted(self._stats.items(), key=lambda kv: -kv[1]['self_time']))
+
+    def dump(self, prefix):
+        '''Writes `<prefix>.json` (summary) and `<prefix>.folded` (flame
+        graph input, exclusive time in microseconds).'''
+        with open(prefix + '.json', 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+        with open(prefix + '.folded', 'w') as f:
+            for key, t in sorted(self._folded.items()):
+                us = int(round(t*1e6))
+                if us > 0:
+                    f.write('{} {}\n'.format(key, us))
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.disable()
+
+
+def profile_from_environment():
+    '''Profiles the whole script if `NIFTY_TUTORIAL_PROFILE` is set.
+
+    The profile is written to `<NIFTY_TUTORIAL_PROFILE>.json` and
+    `<NIFTY_TUTORIAL_PROFILE>.folded` when the interpreter exits. Returns
+    the profiler, or None.
+    '''
+    prefix = os.environ.get('NIFTY_TUTORIAL_PROFILE', '')
+    if prefix == '':
+        return None
+    profiler = OperatorProfiler()
+    profiler.enable()
+    pid = os.getpid()
+
+    def _dump():
+        # forked sample workers inherit the profiler, only the parent writes
+        if os.getpid() == pid:
+            profiler.dump(prefix)
+
+    atexit.register(_dump)
+    return profiler
@@ -0,0 +1,190 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import atexit
+import multiprocessing as mp
+import os
+import sys
+import traceback
+
+import numpy as np
+
+_async = [os.environ.get('NIFTY_TUTORIAL_ASYNC_PLOTS', '0') not in ('', '0')]
+_display_pixels = [int(os.environ.get('NIFTY_TUTORIAL_PLOT_PIXELS', 512))]
+_renderer = [None]
+
+
+class ImagePyramid(object):
+    '''Block-wise minima and maxima of a 2D array at successively halved
+    resolutions.
+
+    Level 0 is the array itself; every further level combines 2x2 blocks of
+    the previous one (odd edges are padded by repetition), so that the
+    minimum and maximum of every level equal those of the array. `image`
+    picks, per pixel of the coarsest level which still has the requested
+    resolution, the block minimum or maximum, whichever deviates more from
+    the mean. Narrow peaks and holes therefore stay visible, unlike with
+    averaging or striding.
+    '''
+
+    def __init__(self, arr):
+        arr = np.asarray(arr)
+        if arr.ndim != 2:
+            raise ValueError('ImagePyramid needs a 2D array')
+        self._levels = [(arr, arr)]
+        self._mean = np.mean(arr)
+
+    @staticmethod
+    def _reduce(arr, func):
+        pad = [(0, s % 2) for s in arr.shape]
+        arr = np.pad(arr, pad, mode='edge')
+        n0, n1 = arr.shape[0]//2, arr.shape[1]//2
+        return func(arr.reshape(n0, 2, n1, 2), axis=(1, 3))
+
+    def level(self, i):
+        '''Minima and maxima of level `i`.'''
+        while len(self._levels) <= i:
+            lo, hi = self._levels[-1]
+            if max(lo.shape) == 1:
+                break
+            self._levels.append((self._reduce(lo, np.min),
+                                 self._reduce(hi, np.max)))
+        return self._levels[min(i, len(self._levels) - 1)]
+
+    @property
+    def vmin(self):
+        return self._levels[0][0].min()
+
+    @property
+    def vmax(self):
+        return self._levels[0][1].max()
+
+    def image(self, max_pixels=None):
+        '''Image with at most `max_pixels` (default: the display resolution)
+        pixels along each axis.'''
+        if max_pixels is None:
+            max_pixels = _display_pixels[0]
+        n = max(self._levels[0][0].shape)
+        i = 0
+        while n > max_pixels:
+            n = (n + 1)//2
+            i += 1
+        lo, hi = self.level(i)
+        if i == 0:
+            return lo
+        return np.where(hi - self._mean > self._mean - lo, hi, lo)
+
+
+def display_image(arr, max_pixels=None):
+    '''`arr` downsampled to display resolution with an ImagePyramid.'''
+    return ImagePyramid(arr).image(max_pixels)
+
+
+def _render_loop(queue):
+    import matplotlib
+    matplotlib.use('Agg')
+    while True:
+        job = queue.get()
+        try:
+            if job is None:
+                break
+            func, args = job
+            func(*args)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            queue.task_done()
+
+
+class Renderer(object):
+    '''Background process which renders figures from a queue.
+
+    `submit` returns immediately; the arguments are pickled, so plot
+    functions should hand over display-resolution numpy arrays rather than
+    Fields. Figures which are still queued are rendered by `close`, which
+    is registered to run at interpreter exit.
+    '''
+
+    def __init__(self):
+        ctx = mp.get_context('fork')
+        self._queue = ctx.JoinableQueue()
+        self._proc = ctx.Process(
+            target=_render_loop, args=(self._queue,), daemon=True)
+        self._proc.start()
+        pid = os.getpid()
+
+        def _close():
+            # forked processes inherit the renderer, only its owner closes it
+            if os.getpid() == pid:
+                self.close()
+
+        atexit.register(_close)
+
+    def submit(self, func, *args):
+        self._queue.put((func, args))
+
+    def wait(self):
+        '''Blocks until all submitted figures are written.'''
+        if self._proc is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._proc is None:
+            return
+        self._queue.put(None)
+        self._proc.join()
+        self._proc = None
+
+
+def set_async_plotting(enabled=True):
+    '''If enabled, the plot functions of the helpers prepare their arrays in
+    the calling process and render the figure in a background Renderer. The
+    default is taken from the environment variable
+    `NIFTY_TUTORIAL_ASYNC_PLOTS`.'''
+    _async[0] = bool(enabled)
+
+
+def set_display_pixels(n):
+    '''Maximum resolution along each axis of the images in plots; larger
+    fields are downsampled with an ImagePyramid. The default is taken from
+    the environment variable `NIFTY_TUTORIAL_PLOT_PIXELS`, or 512.'''
+    _display_pixels[0] = int(n)
+
+
+def _is_master():
+    # NIFTy imports mpi4py when it runs distributed; do not import it here
+    mpi = sys.modules.get('mpi4py.MPI')
+    return mpi is None or mpi.COMM_WORLD.Get_rank() == 0
+
+
+def render(func, *args):
+    '''Calls `func(*args)`, in the background Renderer if asynchronous
+    plotting is enabled. With MPI, only the first task renders; the others
+    have gathered the same arrays.'''
+    if not _is_master():
+        return
+    if not _async[0]:
+        return func(*args)
+    if _renderer[0] is None:
+        _renderer[0] = Renderer()
+    _renderer[0].submit(func, *args)
+
+
+def wait_for_plots():
+    '''Blocks until all figures submitted so far are written.'''
+    if _renderer[0] is not None:
+        _renderer[0].wait()
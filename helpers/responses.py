@@ -16,38 +16,136 @@
 # NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
 
 import numpy as np
+from scipy.sparse import csr_matrix, vstack
 
 import nifty5 as ift
 
+from .cache import DiskCache, cache_key
 
-def checkerboard_response(position_space):
+
+_DEFAULT_BANDS = ((1/3, 1/2, 2.), (4/5, 1., .1), (1/2, 3/2, 3.))
+
+
+def _tile_index(n, n_tiles):
+    bounds = np.arange(n_tiles + 1)*n//n_tiles
+    return np.searchsorted(bounds, np.arange(n), side='right') - 1
+
+
+def tiled_mask(shape, n_tiles=8):
+    '''Flags of a checkerboard with `n_tiles` tiles per axis.
+
+    Tiles whose indices add up to an even number are observed (0), the
+    others are flagged (1). Works for any number of dimensions, `n_tiles`
+    may be given per axis.
+    '''
+    n_tiles = np.broadcast_to(n_tiles, (len(shape),))
+    parity = sum(
+        _tile_index(n, t).reshape((-1,) + (1,)*(len(shape) - 1 - k))
+        for k, (n, t) in enumerate(zip(shape, n_tiles)))
+    return np.broadcast_to(parity % 2, shape).astype(np.float64)
+
+
+def banded_exposure(shape, bands=None):
+    '''Exposure which is a product of bands along the axes.
+
+    Every band `(lo, hi, factor)` multiplies the pixels from `lo` to `hi`
+    (fractions of the axis length) along every axis by `factor`. Bands can
+    also be given per axis as `{axis: [(lo, hi, factor), ...]}`.
+    '''
+    if bands is None:
+        bands = _DEFAULT_BANDS
+    if not isinstance(bands, dict):
+        bands = {k: bands for k in range(len(shape))}
+    res = np.ones(shape)
+    for axis, axis_bands in bands.items():
+        n = shape[axis]
+        if len(axis_bands) == 0:
+            continue
+        lo, hi, fct = np.array(axis_bands, dtype=np.float64).T
+        lo, hi = np.floor(lo*n + 1e-9), np.floor(hi*n + 1e-9)
+        idx = np.arange(n)
+        inside = (idx >= lo[:, None]) & (idx < hi[:, None])
+        profile = np.prod(np.where(inside, fct[:, None], 1.), axis=0)
+        res *= profile.reshape((-1,) + (1,)*(len(shape) - 1 - axis))
+    return res
+
+
+class MaskedExposureResponse(ift.LinearOperator):
+    '''Exposure, geometry removal and masking in one operator.
+
+    Equivalent to `MaskOperator(flags) @ GeometryRemover @ makeOp(exposure)`
+    but every application gathers (or scatters) the observed pixels and
+    multiplies by their exposure in a single pass.
+
+    Parameters
+    ----------
+    domain : Domain, tuple of Domain or DomainTuple
+        The position space.
+    exposure : numpy.ndarray, optional
+        Exposure per pixel. Defaults to one.
+    flags : numpy.ndarray, optional
+        Pixels where `flags` is true are not observed. Without flags the
+        target is an UnstructuredDomain of the domain shape, like the one of
+        `GeometryRemover`.
+    '''
+
+    def __init__(self, domain, exposure=None, flags=None):
+        self._domain = ift.DomainTuple.make(domain)
+        self._capability = self.TIMES | self.ADJOINT_TIMES
+        shp = self._domain.shape
+        if flags is None:
+            self._ind = None
+            self._target = ift.DomainTuple.make(ift.UnstructuredDomain(shp))
+            self._exp = None if exposure is None else np.broadcast_to(
+                exposure, shp).ravel()
+        else:
+            flags = np.broadcast_to(flags, shp).astype(bool)
+            self._ind = np.flatnonzero(~flags)
+            self._target = ift.DomainTuple.make(
+                ift.UnstructuredDomain(self._ind.size))
+            self._exp = None if exposure is None else np.broadcast_to(
+                exposure, shp).ravel()[self._ind]
+
+    def apply(self, x, mode):
+        self._check_input(x, mode)
+        x = x.to_global_data()
+        if mode == self.TIMES:
+            x = x.ravel()
+            res = x if self._ind is None else x[self._ind]
+            if self._exp is not None:
+                res = res*self._exp
+            return ift.from_global_data(self._target,
+                                        res.reshape(self._target.shape))
+        x = x.ravel()
+        if self._exp is not None:
+            x = x*self._exp
+        if self._ind is None:
+            res = x
+        else:
+            res = np.zeros(self._domain.size, dtype=x.dtype)
+            res[self._ind] = x
+        return ift.from_global_data(self._domain,
+                                    res.reshape(self._domain.shape))
+
+
+def checkerboard_response(position_space, n_tiles=8):
     '''Checkerboard mask for 2D mode'''
-    mask = np.ones(position_space.shape)
-    x, y = position_space.shape
-    for i in range(8):
-        for j in range(8):
-            if (i + j) % 2 == 0:
-                mask[i*x//8:(i + 1)*x//8, j*y//8:(j + 1)*y//8] = 0
+    mask = tiled_mask(position_space.shape, n_tiles)
     mask = ift.from_global_data(position_space, mask)
     return ift.MaskOperator(mask)
 
 
-def exposure_response(position_space):
+def exposure_response(position_space, bands=None):
     '''Structured exposure for 2D mode'''
-    x_shape, y_shape = position_space.shape
+    exposure = banded_exposure(position_space.shape, bands)
+    return MaskedExposureResponse(position_space, exposure)
 
-    exposure = np.ones(position_space.shape)
-    exposure[x_shape//3:x_shape//2, :] *= 2.
-    exposure[x_shape*4//5:x_shape, :] *= .1
-    exposure[x_shape//2:x_shape*3//2, :] *= 3.
-    exposure[:, x_shape//3:x_shape//2] *= 2.
-    exposure[:, x_shape*4//5:x_shape] *= .1
-    exposure[:, x_shape//2:x_shape*3//2] *= 3.
 
-    exposure = ift.Field.from_global_data(position_space, exposure)
-    E = ift.makeOp(exposure)
-    G = ift.GeometryRemover(E.target)
-    return G @ E
+def masked_exposure_response(position_space, n_tiles=8, bands=None):
+    '''Structured exposure with checkerboard mask'''
+    exposure = banded_exposure(position_space.shape, bands)
+    flags = tiled_mask(position_space.shape, n_tiles)
+    return MaskedExposureResponse(position_space, exposure, flags)
 
 
 def psf_response(position_space):
@@ -59,10 +157,91 @@ def psf_response(position_space):
 def radial_tomography_response(position_space, lines_of_sight=100):
     starts = list(np.random.uniform(0, 1, (lines_of_sight, 2)).T)
     ends = list(0.5 + 0*np.random.uniform(0, 1, (lines_of_sight, 2)).T)
-    return ift.LOSResponse(position_space, starts=starts, ends=ends)
+    return cached_los_response(position_space, starts=starts, ends=ends)
 
 
 def random_tomography_response(position_space, lines_of_sight=100):
     starts = list(np.random.uniform(0, 1, (lines_of_sight, 2)).T)
     ends = list(np.random.uniform(0, 1, (lines_of_sight, 2)).T)
-    return ift.LOSResponse(position_space, starts=starts, ends=ends)
+    return cached_los_response(position_space, starts=starts, ends=ends)
+
+
+class SparseResponse(ift.LinearOperator):
+    '''Linear response given by a sparse (data x pixels) matrix.'''
+
+    def __init__(self, domain, matrix):
+        self._domain = ift.DomainTuple.make(domain)
+        self._target = ift.DomainTuple.make(
+            ift.UnstructuredDomain(matrix.shape[0]))
+        self._capability = self.TIMES | self.ADJOINT_TIMES
+        if matrix.shape[1] != self._domain.size:
+            raise ValueError('matrix does not match the domain')
+        self._mat = matrix
+
+    @property
+    def matrix(self):
+        return self._mat
+
+    def apply(self, x, mode):
+        self._check_input(x, mode)
+        if mode == self.TIMES:
+            res = self._mat.dot(x.to_global_data().reshape(-1))
+            return ift.from_global_data(self._target, res)
+        res = self._mat.T.dot(x.to_global_data())
+        return ift.from_global_data(self._domain,
+                                    res.reshape(self._domain.shape))
+
+
+def _los_matrix(los):
+    smat = los._smat
+    mat = getattr(smat, 'A', None)
+    if mat is None:
+        # Probe the operator if it does not expose its matrix, with one
+        # block of columns of the identity at a time
+        nlos, npix = smat.shape
+        cols = [
+            csr_matrix(smat.rmatmat(
+                np.eye(nlos, min(256, nlos - lo), k=-lo)).T)
+            for lo in range(0, nlos, 256)
+        ]
+        mat = vstack(cols)
+    return csr_matrix(mat)
+
+
+def cached_los_response(position_space, starts, ends, sigmas_low=None,
+                        sigmas_up=None, cache=None):
+    '''Line-of-sight response whose ray/pixel intersections are cached on
+    disk.
+
+    The sparse intersection matrix computed by `ift.LOSResponse` is stored
+    in `cache` (by default `DiskCache('los')`) under a key derived from the
+    shape and distances of `position_space` and the line-of-sight arrays.
+    Later calls with the same arguments memory-map the matrix instead of
+    recomputing it.
+    '''
+    if cache is None:
+        cache = DiskCache('los')
+    dom = ift.DomainTuple.make(position_space)
+    key = cache_key(dom.shape, dom[0].distances, np.asarray(starts, float),
+                    np.asarray(ends, float),
+                    None if sigmas_low is None else np.asarray(sigmas_low),
+                    None if sigmas_up is None else np.asarray(sigmas_up))
+    arrs = cache.load(key)
+    if arrs is None:
+        los = ift.LOSResponse(position_space, starts=starts, ends=ends,
+                              sigmas_low=sigmas_low, sigmas_up=sigmas_up)
+        mat = _los_matrix(los)
+        # indptr counts up to nnz
+        itype = np.int32 if max(mat.shape + (mat.nnz,)) < 2**31 \
+            else np.int64
+        arrs = {
+            'data': mat.data,
+            'indices': mat.indices.astype(itype),
+            'indptr': mat.indptr.astype(itype),
+            'shape': np.array(mat.shape)
+        }
+        cache.store(key, arrs)
+        arrs = cache.load(key)
+    mat = csr_matrix((arrs['data'], arrs['indices'], arrs['indptr']),
+                     shape=tuple(arrs['shape']), copy=False)
+    return SparseResponse(dom, mat)
@@ -0,0 +1,162 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .cache import DiskCache, cache_key
+from .distributed import is_master
+
+
+class PosteriorResult(object):
+    '''Position and samples of a KL, e.g. loaded from a ResultCache. Can be
+    passed to `plot_reconstruction_2d` instead of the KL.'''
+
+    def __init__(self, position, samples):
+        self._position = position
+        self._samples = tuple(samples)
+
+    @property
+    def position(self):
+        return self._position
+
+    @property
+    def samples(self):
+        return self._samples
+
+    def iter_samples(self):
+        return iter(self._samples)
+
+
+def _pack(name, val, arrays, kinds):
+    if isinstance(val, str):
+        arrays[name], kind = np.array(val), 'str'
+    elif isinstance(val, ift.MultiField):
+        for k, v in val.to_global_data().items():
+            arrays[name + ':' + k] = v
+        kind = 'multifield'
+    elif isinstance(val, ift.Field):
+        arrays[name], kind = val.to_global_data(), 'field'
+    elif isinstance(val, (list, tuple)) and len(val) > 0 and isinstance(
+            val[0], ift.MultiField):
+        for k in val[0].domain.keys():
+            arrays[name + ':' + k] = np.stack(
+                [v[k].to_global_data() for v in val])
+        kind = 'multifields'
+    elif isinstance(val, (list, tuple)) and len(val) > 0 and isinstance(
+            val[0], ift.Field):
+        arrays[name] = np.stack([v.to_global_data() for v in val])
+        kind = 'fields'
+    else:
+        arrays[name], kind = np.asarray(val), 'array'
+    kinds.append('{}={}'.format(name, kind))
+
+
+def _unpack(name, kind, arrays, domain):
+    if kind == 'str':
+        return str(arrays[name])
+    if kind == 'array' or domain is None:
+        if kind.startswith('multifield'):
+            return {k.split(':', 1)[1]: v for k, v in arrays.items()
+                    if k.startswith(name + ':')}
+        return arrays[name]
+    if kind == 'field':
+        return ift.from_global_data(domain, arrays[name])
+    if kind == 'fields':
+        return [ift.from_global_data(domain, a) for a in arrays[name]]
+    if kind == 'multifield':
+        return ift.MultiField.from_global_data(
+            domain, {k: arrays[name + ':' + k] for k in domain.keys()})
+    n = len(arrays[name + ':' + next(iter(domain.keys()))])
+    return [
+        ift.MultiField.from_global_data(
+            domain, {k: arrays[name + ':' + k][i] for k in domain.keys()})
+        for i in range(n)
+    ]
+
+
+class ResultCache(object):
+    '''Content-addressed store of the results of the stages of a run.
+
+    Every stage of a run (e.g. data generation, KL minimization, posterior
+    sampling) gets a key which hashes its configuration together with the
+    key of the stage it depends on, so that changing a setting invalidates
+    exactly the stages downstream of it::
+
+        results = ResultCache('criticalfilter')
+        k_data = results.key('data', position_space, amplitude, noise, seed)
+        k_kl = results.key('kl', k_data, controller_settings, n_samples)
+        res = results.cached(k_kl, minimize, {'position': H.domain})
+
+    Results are dicts of strings, arrays, Fields, MultiFields or lists of
+    (Multi)Fields. They are stored uncompressed in `cache` (by default
+    `DiskCache('results')`), whose size limit is enforced by evicting the
+    least recently used results.
+
+    With MPI, all tasks gather the results but only the first one writes
+    them.
+    '''
+
+    def __init__(self, name, cache=None):
+        self._name = name
+        self._cache = DiskCache('results') if cache is None else cache
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def key(self, stage, *config):
+        '''Key of `stage` with the given configuration. Configuration items
+        may be numbers, strings, domains, arrays, dicts, sequences, named
+        functions and keys of other stages.'''
+        return '{}-{}-{}'.format(self._name, stage,
+                                 cache_key(self._name, stage, *config))
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def store(self, key, result):
+        arrays, kinds = {}, []
+        for name, val in result.items():
+            _pack(name, val, arrays, kinds)
+        arrays['__kinds'] = np.array(kinds)
+        if is_master():
+            self._cache.store(key, arrays)
+
+    def load(self, key, domains=None):
+        '''The stored result, with Fields and MultiFields on the domains
+        given by name in `domains` (other entries are returned as arrays),
+        or None on a miss.'''
+        arrays = self._cache.load(key, mmap_mode=None)
+        if arrays is None:
+            return None
+        domains = {} if domains is None else domains
+        res = {}
+        for kind in arrays.pop('__kinds'):
+            name, kind = str(kind).split('=', 1)
+            res[name] = _unpack(name, kind, arrays, domains.get(name))
+        return res
+
+    def cached(self, key, compute, domains=None):
+        '''Loads the result of `key`, or calls `compute()` and stores the
+        dict it returns.'''
+        res = self.load(key, domains)
+        if res is None:
+            res = compute()
+            self.store(key, res)
+        return res
@@ -0,0 +1,151 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+
+def _rms(field):
+    # vdot is reduced over the MPI tasks, the field is not gathered
+    fields = field.values() if isinstance(field, ift.MultiField) else [field]
+    return np.sqrt(field.vdot(field)/sum(f.size for f in fields))
+
+
+class AdaptiveKLSchedule(object):
+    '''Decides on the sample count and the end of the outer KL loop.
+
+    The loop starts with the smallest sample count. Whenever the decrease of
+    the KL in a minimization is not larger than `noise_ratio` times its
+    standard error, the estimate is too noisy to resolve further progress
+    and the sample count is doubled (up to the largest one). The error is
+    estimated from the spread of the decreases of the Hamiltonians of the
+    individual samples.
+    The loop stops once the RMS change of the position falls below
+    `position_tol` and the decrease of the KL below `energy_tol`.
+
+    Usage::
+
+        schedule = AdaptiveKLSchedule(10, (2, 5))
+        for i in schedule.iterations():
+            KL = ParallelMetricGaussianKL(mean, workers, schedule.n_samples)
+            KL_new, convergence = minimizer(KL)
+            schedule.update(KL, KL_new)
+            mean = KL_new.position
+        print(schedule.report())
+
+    Parameters
+    ----------
+    n_iterations : int
+        Maximum number of outer iterations.
+    n_samples : tuple of int
+        Smallest and largest sample count.
+    position_tol, energy_tol : float
+        Convergence thresholds.
+    noise_ratio : float
+        Signal-to-noise ratio of the KL decrease below which the sample
+        count is raised.
+    '''
+
+    def __init__(self, n_iterations=10, n_samples=(2, 5), position_tol=1e-2,
+                 energy_tol=1e-1, noise_ratio=1.):
+        self._n_iterations = int(n_iterations)
+        self._n_min, self._n_max = n_samples
+        self._n = self._n_min
+        self._position_tol = position_tol
+        self._energy_tol = energy_tol
+        self._noise_ratio = noise_ratio
+        self._converged = False
+        self._history = []
+        self._last_evaluations = 0
+
+    @property
+    def n_samples(self):
+        return self._n
+
+    @property
+    def converged(self):
+        return self._converged
+
+    @property
+    def history(self):
+        '''One dict per completed outer iteration.'''
+        return self._history
+
+    def get_state(self):
+        '''Sample count, convergence and history, e.g. for a KLCheckpoint.'''
+        return {'n_samples': self._n, 'converged': self._converged,
+                'history': self._history}
+
+    def set_state(self, state):
+        self._n = int(state['n_samples'])
+        self._converged = bool(state['converged'])
+        self._history = list(state['history'])
+
+    def iterations(self, first=0):
+        for i in range(first, self._n_iterations):
+            if self._converged:
+                return
+            yield i
+
+    def update(self, KL, KL_new):
+        n = KL.n_samples
+        diff = KL.sample_values - KL_new.sample_values
+        err = np.std(diff, ddof=1)/np.sqrt(n) if n > 1 else np.inf
+        d_energy = KL.value - KL_new.value
+        d_position = _rms(KL_new.position - KL.position)
+        evaluations = KL.workers.evaluations
+        used = evaluations - self._last_evaluations
+        self._last_evaluations = evaluations
+        self._history.append({
+            'n_samples': int(n),
+            'energy': float(KL_new.value),
+            'energy_change': float(d_energy),
+            'energy_error': float(err),
+            'position_change': float(d_position),
+            'evaluations': int(used)
+        })
+        if d_energy <= self._noise_ratio*err and self._n < self._n_max:
+            self._n = min(2*self._n, self._n_max)
+        elif d_position < self._position_tol and \
+                abs(d_energy) < self._energy_tol:
+            self._converged = True
+
+    def report(self, n_samples_fixed=None):
+        '''Summary of the evaluations used compared with the fixed schedule
+        of `n_iterations` iterations with `n_samples_fixed` (by default the
+        largest sample count) samples. Evaluations are counted per sample as
+        in `SampleWorkers.evaluations`: energies, metric applications and
+        sampling CG iterations.
+
+        The cost of the fixed schedule is extrapolated from the evaluations
+        per sample measured in the completed iterations.
+        '''
+        if n_samples_fixed is None:
+            n_samples_fixed = self._n_max
+        if not self._history:
+            return 'no KL iterations done'
+        used = sum(h['evaluations'] for h in self._history)
+        per_sample = np.mean(
+            [h['evaluations']/h['n_samples'] for h in self._history])
+        fixed = per_sample*n_samples_fixed*self._n_iterations
+        return ('{} outer iterations ({}), {} evaluations, '
+                '{:.0f} saved compared with {} iterations of {} samples'
+                .format(len(self._history),
+                        'converged' if self._converged else 'not converged',
+                        used, fixed - used, self._n_iterations,
+                        n_samples_fixed))
@@ -0,0 +1,243 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+
+def _index_type(domain):
+    return np.int32 if domain.size < 2**31 else np.int64
+
+
+def _indices(domain, observed):
+    if observed is None:
+        return None
+    if isinstance(observed, ift.Field):
+        observed = observed.to_global_data()
+    observed = np.broadcast_to(observed, domain.shape).astype(bool)
+    return np.flatnonzero(observed).astype(_index_type(domain))
+
+
+def observed_pixels(R):
+    '''Data pixels which response `R` actually observes (nonzero response
+    to a constant signal), or None if all of them are.'''
+    res = R(ift.full(R.domain, 1.)).to_global_data() != 0
+    return None if np.all(res) else res
+
+
+class _Gather(ift.LinearOperator):
+    '''Picks the pixels `indices` (of the flattened domain) into an
+    UnstructuredDomain; the adjoint scatters them back.'''
+
+    def __init__(self, domain, indices):
+        self._domain = ift.DomainTuple.make(domain)
+        self._target = ift.DomainTuple.make(
+            ift.UnstructuredDomain(indices.size))
+        self._capability = self.TIMES | self.ADJOINT_TIMES
+        self._ind = indices
+
+    def apply(self, x, mode):
+        self._check_input(x, mode)
+        x = x.to_global_data()
+        if mode == self.TIMES:
+            return ift.from_global_data(self._target, x.ravel()[self._ind])
+        res = np.zeros(self._domain.size, dtype=x.dtype)
+        res[self._ind] = x
+        return ift.from_global_data(self._domain,
+                                    res.reshape(self._domain.shape))
+
+
+class BernoulliData(object):
+    '''Bernoulli data as bits, eight pixels per byte.
+
+    Only the pixels where `observed` is true are stored; the others do not
+    contribute to the likelihood. Use `from_field` to construct it.
+    '''
+
+    def __init__(self, domain, bits, observed=None):
+        self._domain = ift.DomainTuple.make(domain)
+        self._bits = bits
+        self._observed = observed
+
+    @staticmethod
+    def from_field(data, observed=None):
+        ind = _indices(data.domain, observed)
+        vals = data.to_global_data().ravel()
+        if ind is not None:
+            vals = vals[ind]
+        if not np.all((vals == 0) | (vals == 1)):
+            raise ValueError('Bernoulli data must be 0 or 1')
+        return BernoulliData(data.domain, np.packbits(vals != 0), ind)
+
+    @property
+    def domain(self):
+        return self._domain
+
+    @property
+    def observed(self):
+        '''Flat indices of the observed pixels, or None for all.'''
+        return self._observed
+
+    @property
+    def n_observed(self):
+        if self._observed is None:
+            return self._domain.size
+        return self._observed.size
+
+    @property
+    def nbytes(self):
+        res = self._bits.nbytes
+        if self._observed is not None:
+            res += self._observed.nbytes
+        return res
+
+    def values(self):
+        '''The data of the observed pixels as uint8 array.'''
+        return np.unpackbits(self._bits)[:self.n_observed]
+
+    def to_field(self):
+        res = np.zeros(self._domain.size)
+        if self._observed is None:
+            res[:] = self.values()
+        else:
+            res[self._observed] = self.values()
+        return ift.from_global_data(self._domain,
+                                    res.reshape(self._domain.shape))
+
+
+class PoissonCounts(object):
+    '''Poisson counts in sparse form: the flat indices (int32, or int64 for
+    domains of 2**31 pixels or more) and counts (int32) of the pixels with
+    at least one count.
+
+    Pixels where `observed` is false are not stored and do not contribute
+    to the likelihood, e.g. those without exposure. Use `from_field` to
+    construct it.
+    '''
+
+    def __init__(self, domain, indices, counts, observed=None):
+        self._domain = ift.DomainTuple.make(domain)
+        self._ind = indices
+        self._counts = counts
+        self._observed = observed
+
+    @staticmethod
+    def from_field(data, observed=None):
+        ind = _indices(data.domain, observed)
+        vals = data.to_global_data().ravel()
+        if np.any(vals < 0) or np.any(vals != np.round(vals)):
+            raise ValueError('Poisson data must be non-negative integers')
+        nz = np.flatnonzero(vals)
+        if ind is not None:
+            nz = nz[np.isin(nz, ind)]
+        return PoissonCounts(data.domain, nz.astype(_index_type(data.domain)),
+                             vals[nz].astype(np.int32), ind)
+
+    @property
+    def domain(self):
+        return self._domain
+
+    @property
+    def observed(self):
+        '''Flat indices of the observed pixels, or None for all.'''
+        return self._observed
+
+    @property
+    def indices(self):
+        return self._ind
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def nbytes(self):
+        res = self._ind.nbytes + self._counts.nbytes
+        if self._observed is not None:
+            res += self._observed.nbytes
+        return res
+
+    def to_field(self):
+        res = np.zeros(self._domain.size)
+        res[self._ind] = self._counts
+        return ift.from_global_data(self._domain,
+                                    res.reshape(self._domain.shape))
+
+
+class SparsePoissonianEnergy(ift.EnergyOperator):
+    '''`ift.PoissonianEnergy` evaluated on PoissonCounts.
+
+        E(lambda) = sum_observed lambda - sum_counts d log(lambda)
+
+    The logarithm is only evaluated at the pixels with counts, the metric
+    `diag(1/lambda)` only on the observed pixels.
+    '''
+
+    def __init__(self, data):
+        self._domain = data.domain
+        self._data = data
+        obs = data.observed
+        self._observed = None if obs is None else _Gather(self._domain, obs)
+        self._nonzero = _Gather(self._domain, data.indices)
+
+    def apply(self, x):
+        self._check_input(x)
+        lam = x if self._observed is None else self._observed(x)
+        res = lam.sum()
+        tmp = res.val.local_data if isinstance(res, ift.Linearization) else res
+        # with an infinite rate the energy is infinite anyway
+        if not np.isinf(tmp):
+            d = ift.from_global_data(self._nonzero.target,
+                                     self._data.counts.astype(np.float64))
+            res = res - self._nonzero(x).log().vdot(d)
+        if not isinstance(x, ift.Linearization):
+            return ift.Field.scalar(res)
+        if not x.want_metric:
+            return res
+        metric = ift.SandwichOperator.make(lam.jac, ift.makeOp(1./lam.val))
+        return res.add_metric(metric)
+
+
+class SparseBernoulliEnergy(ift.EnergyOperator):
+    '''`ift.BernoulliEnergy` evaluated on BernoulliData.
+
+    The bits of the observed pixels are unpacked for every evaluation;
+    unobserved pixels are skipped entirely.
+    '''
+
+    def __init__(self, data):
+        self._domain = data.domain
+        self._data = data
+        obs = data.observed
+        self._observed = None if obs is None else _Gather(self._domain, obs)
+
+    def apply(self, x):
+        self._check_input(x)
+        p = x if self._observed is None else self._observed(x)
+        dom = p.target if isinstance(p, ift.Linearization) else p.domain
+        d = self._data.values().astype(np.float64).reshape(dom.shape)
+        # p where d is 1, 1 - p where it is 0
+        q = p*ift.from_global_data(dom, 2*d - 1) + ift.from_global_data(
+            dom, 1 - d)
+        v = -q.log().sum()
+        if not isinstance(x, ift.Linearization):
+            return ift.Field.scalar(v)
+        if not x.want_metric:
+            return v
+        met = ift.makeOp(1./(p.val*(1. - p.val)))
+        return v.add_metric(ift.SandwichOperator.make(p.jac, met))
@@ -0,0 +1,144 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+from .wiener import WienerFilter
+
+
+def _output(out, n):
+    if isinstance(out, str):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=np.float64,
+                                         shape=(n,))
+    return out
+
+
+class StreamingWienerFilter(object):
+    '''Wiener filter of an arbitrarily long, regularly sampled 1D series
+    with stationary prior and white noise, in blocks of bounded size.
+
+    The posterior mean is a convolution of the data with a kernel which
+    decays on the correlation length of the prior. It is computed with
+    overlap-save: every block of `block_size` samples is solved exactly on
+    a periodic `RGSpace(block_size)` with the spectral WienerFilter, and
+    only its central part, `margin` samples away from both block edges, is
+    kept. The kept parts tile the series. The error is that of truncating
+    the kernel at `margin`, so the margin should cover a few correlation
+    lengths.
+
+    Away from the boundaries, the posterior variance is constant and equal
+    to that of a block.
+
+    Parameters
+    ----------
+    spectrum : callable
+        Prior power spectrum as a function of k, as for
+        `ift.create_power_operator`.
+    noise : float
+        Noise variance per sample.
+    distance : float
+        Sampling distance. To reproduce a solve on `RGSpace(n)`, this is
+        its distance `1/n`.
+    block_size : int
+        Samples per block. Memory use is proportional to it.
+    margin : int, optional
+        Samples discarded on either side of a block. Defaults to a quarter
+        of the block size.
+    '''
+
+    def __init__(self, spectrum, noise, distance=1., block_size=4096,
+                 margin=None):
+        if margin is None:
+            margin = block_size//4
+        if block_size - 2*margin < 1:
+            raise ValueError('margin too large for the block size')
+        self._spectrum, self._noise = spectrum, noise
+        self._distance = distance
+        self._block_size, self._margin = int(block_size), int(margin)
+        self._filters = {}
+
+    def _filter(self, size):
+        if size not in self._filters:
+            space = ift.RGSpace(size, distances=self._distance)
+            harmonic_space = space.get_default_codomain()
+            HT = ift.HartleyOperator(harmonic_space, target=space)
+            R = ift.GeometryRemover(space)
+            N = ift.ScalingOperator(self._noise, R.target)
+            S_h = ift.create_power_operator(harmonic_space, self._spectrum)
+            wf = WienerFilter(R, N, HT, S_h)
+            if not wf.fast:
+                raise RuntimeError('streaming needs the spectral solve')
+            self._filters[size] = wf, R.target
+        return self._filters[size]
+
+    def filter(self, data, mean_out, var_out=None, boundary='periodic'):
+        '''Filters `data` block by block.
+
+        Parameters
+        ----------
+        data : array-like
+            The 1D series, e.g. `np.load(fname, mmap_mode='r')`. Only one
+            block of it is read at a time.
+        mean_out, var_out : str or array
+            Output for posterior mean and variance: a file name for a new
+            `.npy` memmap, or an array of the same length as `data`. They
+            are written progressively and flushed after every block.
+        boundary : str
+            'periodic' continues the series periodically beyond its ends,
+            which reproduces the full-domain solve on `RGSpace(n)`.
+            'reflect' mirrors it at the ends. A series which fits into one
+            block is then solved on its mirrored extension of length
+            `2*n - 2`.
+
+        Returns the mean and variance outputs.
+        '''
+        if boundary not in ('periodic', 'reflect'):
+            raise ValueError('boundary must be periodic or reflect')
+        n = len(data)
+        mean_out = _output(mean_out, n)
+        var_out = None if var_out is None else _output(var_out, n)
+        if n <= self._block_size:
+            size, margin = n, 0
+            if boundary == 'reflect' and n > 2:
+                # the even extension is periodic, one block holds all of it
+                size = 2*n - 2
+        else:
+            size, margin = self._block_size, self._margin
+        wf, data_space = self._filter(size)
+        var = wf.variance().to_global_data()[0]
+        step = size - 2*margin
+        for lo in range(0, n, step):
+            hi = min(lo + step, n)
+            idx = np.arange(lo - margin, lo - margin + size)
+            if boundary == 'periodic':
+                idx = idx % n
+            else:
+                idx = np.abs(idx)
+                idx = np.where(idx >= n, 2*n - 2 - idx, idx)
+                idx = np.clip(idx, 0, n - 1)
+            block = np.asarray(data[idx], dtype=np.float64)
+            d = ift.from_global_data(data_space, block)
+            m = wf.mean(d).to_global_data()
+            mean_out[lo:hi] = m[margin:margin + hi - lo]
+            if var_out is not None:
+                var_out[lo:hi] = var
+            for out in (mean_out, var_out):
+                if isinstance(out, np.memmap):
+                    out.flush()
+        return mean_out, var_out
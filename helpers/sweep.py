@@ -0,0 +1,273 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import multiprocessing as mp
+import multiprocessing.connection
+import os
+import traceback
+
+import numpy as np
+
+import nifty5 as ift
+
+from .checkpoint import KLCheckpoint
+from .generate_data import (generate_bernoulli_data, generate_gaussian_data,
+                            generate_poisson_data)
+from .geometry import cached_power_space
+from .parallel import ParallelMetricGaussianKL, SampleWorkers
+from .plot import plot_prior_samples_2d, plot_reconstruction_2d
+from .preconditioning import SamplingHamiltonian
+from .schedule import AdaptiveKLSchedule
+from .sparse_data import (BernoulliData, PoissonCounts, SparseBernoulliEnergy,
+                          SparsePoissonianEnergy, observed_pixels)
+from .telemetry import TelemetryStream
+
+DEFAULT_AMPLITUDE = {
+    'n_pix': 64,
+    'a': 10,
+    'k0': .2,
+    'sm': -4,
+    'sv': .6,
+    'im': -3,
+    'iv': 2.
+}
+
+
+class Scenario(object):
+    '''One inference problem of a ScenarioSweep.
+
+    Parameters
+    ----------
+    name : str
+        Name of the plots, checkpoint and telemetry stream.
+    likelihood : str
+        'gauss' (signal is the correlated field), 'bernoulli' (its sigmoid)
+        or 'poisson' (its exponential).
+    response : callable
+        Builds the response from the position space, e.g.
+        `checkerboard_response`.
+    seed : int
+        Seed of the synthetic data and the KL samples.
+    amplitude : dict, optional
+        Parameters of the SLAmplitude, in addition to `DEFAULT_AMPLITUDE`.
+    noise : float
+        Noise variance for 'gauss'.
+    n_iterations : int
+        Maximum number of KL iterations.
+    n_samples : tuple of int
+        Smallest and largest sample count of the AdaptiveKLSchedule.
+    n_posterior_samples : int
+        Samples for the final plots.
+    n_prior_samples : int
+        Prior samples to plot; 0 for none.
+    '''
+
+    def __init__(self, name, likelihood, response, seed=42, amplitude=None,
+                 noise=0.1, n_iterations=5, n_samples=(2, 5),
+                 n_posterior_samples=30, n_prior_samples=5):
+        if likelihood not in ('gauss', 'bernoulli', 'poisson'):
+            raise ValueError('likelihood type not implemented')
+        self.name, self.likelihood, self.response = name, likelihood, response
+        self.seed, self.noise = seed, noise
+        self.amplitude = dict(DEFAULT_AMPLITUDE)
+        self.amplitude.update({} if amplitude is None else amplitude)
+        self.n_iterations, self.n_samples = n_iterations, n_samples
+        self.n_posterior_samples = n_posterior_samples
+        self.n_prior_samples = n_prior_samples
+
+
+class ScenarioSweep(object):
+    '''Runs independent inference scenarios on the same position space
+    concurrently.
+
+    The harmonic and power space, and one amplitude model and correlated
+    field per distinct set of amplitude parameters, are built once and
+    shared with the jobs by forking. Every job gets `cores_per_job` CPU
+    cores (default: `NIFTY_TUTORIAL_SWEEP_CORES`, or an equal share of the
+    available cores): its process is pinned to them and its SampleWorkers
+    use that many processes. As many jobs run at the same time as the
+    budget allows, the others wait for free cores.
+
+    Parameters
+    ----------
+    position_space : Domain
+        Common position space of all scenarios.
+    scenarios : list of Scenario
+    cores_per_job : int, optional
+    '''
+
+    def __init__(self, position_space, scenarios, cores_per_job=None):
+        self._position_space = position_space
+        self._scenarios = list(scenarios)
+        harmonic_space = position_space.get_default_codomain()
+        self._power_space = cached_power_space(harmonic_space)
+        self._amplitudes = {}
+        for sc in self._scenarios:
+            self.correlated_field(sc)
+        if hasattr(os, 'sched_getaffinity'):
+            self._cores = sorted(os.sched_getaffinity(0))
+        else:
+            self._cores = list(range(os.cpu_count()))
+        if cores_per_job is None:
+            cores_per_job = os.environ.get('NIFTY_TUTORIAL_SWEEP_CORES')
+        if cores_per_job is None:
+            cores_per_job = len(self._cores)//max(len(self._scenarios), 1)
+        self._cores_per_job = min(max(int(cores_per_job), 1),
+                                  len(self._cores))
+
+    @property
+    def position_space(self):
+        return self._position_space
+
+    @property
+    def cores_per_job(self):
+        return self._cores_per_job
+
+    def correlated_field(self, scenario):
+        '''Shared amplitude model and correlated field of `scenario`.'''
+        key = tuple(sorted(scenario.amplitude.items()))
+        if key not in self._amplitudes:
+            A = ift.SLAmplitude(target=self._power_space, **scenario.amplitude)
+            cf = ift.CorrelatedField(self._position_space, A)
+            self._amplitudes[key] = A, cf
+        return self._amplitudes[key]
+
+    def run_scenario(self, scenario):
+        '''Runs one scenario in this process and returns its result: name,
+        schedule report and posterior mean position (a dict of arrays).'''
+        np.random.seed(scenario.seed)
+        A, correlated_field = self.correlated_field(scenario)
+        R = scenario.response(self._position_space)
+        N = None
+        if scenario.likelihood == 'gauss':
+            signal = correlated_field
+            N = ift.ScalingOperator(scenario.noise, R.target)
+        elif scenario.likelihood == 'bernoulli':
+            signal = correlated_field.sigmoid()
+        else:
+            signal = correlated_field.exp()
+        signal_response = R @ signal
+        if scenario.likelihood == 'gauss':
+            data, ground_truth = generate_gaussian_data(signal_response, N)
+            likelihood = ift.GaussianEnergy(
+                mean=data, inverse_covariance=N.inverse)(signal_response)
+        elif scenario.likelihood == 'bernoulli':
+            signal_response = signal_response.clip(1e-5, 1 - 1e-5)
+            data, ground_truth = generate_bernoulli_data(signal_response)
+            data = BernoulliData.from_field(data, observed_pixels(R))
+            likelihood = SparseBernoulliEnergy(data) @ signal_response
+        else:
+            data, ground_truth = generate_poisson_data(signal_response)
+            data = PoissonCounts.from_field(data, observed_pixels(R))
+            likelihood = SparsePoissonianEnergy(data) @ signal_response
+        # after the data, with its own seed, so that the data only depend
+        # on the seed of the scenario
+        if scenario.n_prior_samples > 0:
+            plot_prior_samples_2d(scenario.n_prior_samples, signal, R,
+                                  correlated_field, A, scenario.likelihood, N,
+                                  seed=scenario.seed)
+
+        telemetry = TelemetryStream.from_environment(scenario.name)
+        sampling_settings = {'iteration_limit': 100}
+        newton_settings = {'name': 'Newton', 'tol': 1e-6,
+                           'iteration_limit': 50}
+        ic_sampling = ift.GradientNormController(**sampling_settings)
+        ic_newton = telemetry.watch(
+            ift.GradInfNormController(**newton_settings))
+        minimizer = ift.NewtonCG(ic_newton)
+        H = SamplingHamiltonian(likelihood, ic_sampling)
+        with SampleWorkers(H, seed=scenario.seed) as workers:
+            telemetry.count_workers(workers)
+            initial_mean = ift.MultiField.full(H.domain, 0.)
+            schedule = AdaptiveKLSchedule(scenario.n_iterations,
+                                          scenario.n_samples)
+            checkpoint = KLCheckpoint(
+                scenario.name, workers, schedule=schedule,
+                config=(self._position_space, scenario.likelihood,
+                        scenario.response, scenario.seed,
+                        scenario.amplitude, scenario.noise,
+                        scenario.n_iterations, scenario.n_samples,
+                        sampling_settings, newton_settings))
+            mean, first = checkpoint.resume(initial_mean,
+                                            scenario.n_iterations)
+            for i in schedule.iterations(first):
+                KL = ParallelMetricGaussianKL(mean, workers,
+                                              schedule.n_samples)
+                telemetry.outer = i
+                KL_new, convergence = minimizer(KL)
+                schedule.update(KL, KL_new)
+                mean = KL_new.position
+                checkpoint.save(i + 1, mean)
+            KL = ParallelMetricGaussianKL(mean, workers,
+                                          scenario.n_posterior_samples)
+            checkpoint.clear()
+            if scenario.likelihood != 'gauss':
+                data = data.to_field()
+            plot_reconstruction_2d(data, ground_truth, KL, signal, R, A,
+                                   scenario.name)
+        telemetry.close()
+        return {
+            'name': scenario.name,
+            'report': schedule.report(),
+            'mean': mean.to_global_data()
+        }
+
+    def _job(self, conn, scenario, cores):
+        try:
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, cores)
+            os.environ['NIFTY_TUTORIAL_WORKERS'] = str(len(cores))
+            conn.send(self.run_scenario(scenario))
+        except Exception:
+            conn.send({'name': scenario.name,
+                       'error': traceback.format_exc()})
+        finally:
+            conn.close()
+
+    def run(self):
+        '''Runs all scenarios and returns their results in the order of the
+        scenarios. Raises RuntimeError if a scenario failed.'''
+        ctx = mp.get_context('fork')
+        n = self._cores_per_job
+        free = [self._cores[i*n:(i + 1)*n]
+                for i in range(len(self._cores)//n)]
+        pending = list(enumerate(self._scenarios))
+        running, results = {}, [None]*len(self._scenarios)
+        while pending or running:
+            while pending and free:
+                idx, sc = pending.pop(0)
+                cores = free.pop()
+                parent, child = ctx.Pipe(duplex=False)
+                p = ctx.Process(target=self._job, args=(child, sc, cores))
+                p.start()
+                child.close()
+                running[parent] = idx, p, cores
+            for conn in mp.connection.wait(list(running)):
+                idx, p, cores = running.pop(conn)
+                try:
+                    results[idx] = conn.recv()
+                except EOFError:
+                    results[idx] = {'name': self._scenarios[idx].name,
+                                    'error': 'job process died'}
+                p.join()
+                free.append(cores)
+        failed = [r for r in results if 'error' in r]
+        if failed:
+            raise RuntimeError('\n'.join(
+                'scenario {} failed:\n{}'.format(r['name'], r['error'])
+                for r in failed))
+        return results
@@ -0,0 +1,180 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import json
+import os
+import sys
+from time import time
+
+import nifty5 as ift
+
+from .distributed import is_master
+
+
+def _inf_norm(field):
+    # reduced over the MPI tasks by NIFTy, without gathering the field
+    fields = field.values() if isinstance(field, ift.MultiField) else [field]
+    return max(max(f.max(), -f.min()) for f in fields)
+
+
+class CountingController(ift.IterationController):
+    '''Passes through to `controller` and counts its iterations.'''
+
+    def __init__(self, controller):
+        self._controller = controller
+        self.count = 0
+
+    def start(self, energy):
+        return self._controller.start(energy)
+
+    def check(self, energy):
+        self.count += 1
+        return self._controller.check(energy)
+
+
+class TelemetryController(ift.IterationController):
+    '''Passes through to `controller` and writes one record per iteration
+    to `stream`.'''
+
+    def __init__(self, controller, stream):
+        self._controller = controller
+        self._stream = stream
+
+    def _record(self, energy, status):
+        t = time()
+        self._stream.write(
+            step=self._step,
+            energy=float(energy.value),
+            gradient_inf_norm=float(_inf_norm(energy.gradient)),
+            sampling_cg_iterations=self._stream.pop_sampling_count(),
+            step_time=t - self._t,
+            status=int(status))
+        self._t = t
+        self._step += 1
+        return status
+
+    def start(self, energy):
+        self._step, self._t = 0, time()
+        return self._record(energy, self._controller.start(energy))
+
+    def check(self, energy):
+        return self._record(energy, self._controller.check(energy))
+
+
+class TelemetryStream(object):
+    '''Append-only JSONL stream of minimizer telemetry.
+
+    Every record is written as one line and flushed immediately, so that
+    another process can follow the file with `tail -f` or `read_telemetry`.
+    Records contain the `run` name, the `outer` iteration (set by the
+    caller), a time stamp and the fields passed to `write`.
+
+    Use `watch` on the controller of the minimizer. The iterations of the
+    sampling CG are read from a `SampleWorkers` pool passed to
+    `count_workers`, which also covers samples drawn in forked workers, or,
+    for a KL evaluated without such a pool, counted by the controller
+    returned from `count_sampling`. Use one of the two, not both. With a
+    file name of None, nothing is written and `watch` and `count_sampling`
+    return their argument unchanged.
+    '''
+
+    def __init__(self, fname, run=''):
+        self._f = None if fname is None else open(fname, 'a')
+        self._run = run
+        self._sampling = []
+        self._workers = []
+        self.outer = 0
+
+    @staticmethod
+    def from_environment(run):
+        '''Writes to `<NIFTY_TUTORIAL_TELEMETRY>/<run>.jsonl` if that
+        environment variable is set, else returns a disabled stream.
+
+        With MPI, only the first task writes the file. The others write to
+        the null device, since all tasks take part in the reduction of the
+        gradient norm.'''
+        d = os.environ.get('NIFTY_TUTORIAL_TELEMETRY', '')
+        if d == '':
+            return TelemetryStream(None, run)
+        if not is_master():
+            return TelemetryStream(os.devnull, run)
+        os.makedirs(d, exist_ok=True)
+        return TelemetryStream(os.path.join(d, run + '.jsonl'), run)
+
+    @property
+    def enabled(self):
+        return self._f is not None
+
+    def watch(self, controller):
+        if not self.enabled:
+            return controller
+        return TelemetryController(controller, self)
+
+    def count_sampling(self, controller):
+        if not self.enabled:
+            return controller
+        res = CountingController(controller)
+        self._sampling.append(res)
+        return res
+
+    def count_workers(self, workers):
+        '''Counts the sampling CG iterations of `workers`, a SampleWorkers
+        pool over a SamplingHamiltonian, from now on.'''
+        if self.enabled:
+            self._workers.append([workers, workers.sampling_iterations])
+
+    def pop_sampling_count(self):
+        '''CG iterations of the sampling controllers and pools since the
+        last call.'''
+        res = sum(c.count for c in self._sampling)
+        for c in self._sampling:
+            c.count = 0
+        for w in self._workers:
+            n = w[0].sampling_iterations
+            res, w[1] = res + n - w[1], n
+        return res
+
+    def write(self, **record):
+        if not self.enabled:
+            return
+        rec = {'run': self._run, 'outer': self.outer, 'time': time()}
+        rec.update(record)
+        self._f.write(json.dumps(rec) + '\n')
+        self._f.flush()
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def read_telemetry(fname):
+    '''Reads all complete records of a telemetry stream.'''
+    res = []
+    with open(fname) as f:
+        for line in f:
+            if line.endswith('\n'):
+                res.append(json.loads(line))
+    return res
+
+
+if __name__ == '__main__':
+    # python3 -m helpers.telemetry <stream.jsonl> [<name>]
+    from .plot import plot_telemetry
+    fname = sys.argv[1]
+    name = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(fname)[0]
+    plot_telemetry(read_telemetry(fname), name)
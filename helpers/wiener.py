@@ -0,0 +1,229 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright(C) 2013-2019 Max-Planck-Society
+#
+# NIFTy is being developed at the Max-Planck-Institut fuer Astrophysik.
+
+import numpy as np
+
+import nifty5 as ift
+
+
+def _constant_diagonal(op):
+    '''Returns the diagonal of `op` as scalar if `op` is a multiple of the
+    identity, else None.'''
+    if not isinstance(op, (ift.ScalingOperator, ift.DiagonalOperator)):
+        return None
+    diag = op(ift.full(op.domain, 1.)).to_global_data()
+    if diag.size == 0 or not np.all(diag == diag.flat[0]):
+        return None
+    return float(diag.flat[0])
+
+
+def _diagonal(op):
+    if not isinstance(op, (ift.ScalingOperator, ift.DiagonalOperator)):
+        return None
+    return op(ift.full(op.domain, 1.))
+
+
+def _transform_norm(HT):
+    '''c in HT HT^dagger = c 1, from the image of a unit vector, so that it
+    is independent of the volume factors of the transform.'''
+    e = np.zeros(HT.target.shape)
+    e.flat[0] = 1.
+    x = HT.adjoint(ift.from_global_data(HT.target, e))
+    return x.vdot(x)
+
+
+class WienerFilter(object):
+    '''Posterior of the Wiener filter problem
+
+        d = R s + n,  s ~ G(0, S),  n ~ G(0, N),  S = HT S_h HT^dagger,
+
+    with mean m = D R^dagger N^-1 d and covariance
+    D = (S^-1 + R^dagger N^-1 R)^-1.
+
+    If R is a GeometryRemover or ScalingOperator, N is proportional to the
+    identity, S_h is diagonal and HT is a harmonic transform, D is diagonal
+    in the harmonic basis. Mean and samples are then computed exactly with
+    one pair of transforms. Otherwise D is inverted with conjugate gradient
+    as in `1_wiener_filter_solution.py`. This includes noise which is
+    diagonal in the harmonic basis but not white: it is not recognised as
+    such and takes the conjugate gradient path.
+
+    Parameters
+    ----------
+    R : LinearOperator
+        Response, mapping position space to data space.
+    N : EndomorphicOperator
+        Noise covariance on the data space.
+    HT : LinearOperator
+        Harmonic transform from the harmonic to the position space.
+    S_h : EndomorphicOperator
+        Prior covariance on the harmonic space.
+    tol : float
+        Absolute tolerance of the residual norm of the conjugate gradient
+        fallback.
+    iteration_limit : int
+        Iteration limit of the conjugate gradient fallback.
+    '''
+
+    def __init__(self, R, N, HT, S_h, tol=1e-7, iteration_limit=100):
+        self._R, self._N, self._HT, self._S_h = R, N, HT, S_h
+        self._tol, self._iteration_limit = tol, iteration_limit
+        self._w = self._spectral_weights()
+        if self._w is None:
+            ic = ift.GradientNormController(
+                iteration_limit=iteration_limit, tol_abs_gradnorm=tol)
+            S = HT @ S_h @ HT.adjoint
+            self._D_inv = S.inverse + R.adjoint @ N.inverse @ R
+            self._D = ift.InversionEnabler(self._D_inv.inverse, ic,
+                                           approximation=S)
+
+    def _spectral_weights(self):
+        R, HT = self._R, self._HT
+        if isinstance(R, ift.GeometryRemover):
+            r = 1.
+        else:
+            r = _constant_diagonal(R)
+        n = _constant_diagonal(self._N)
+        s = _diagonal(self._S_h)
+        harmonic = isinstance(
+            HT, (ift.HartleyOperator, ift.HarmonicTransformOperator)) and all(
+                isinstance(d, ift.RGSpace) for d in HT.domain)
+        if r is None or n is None or s is None or not harmonic:
+            return None
+        self._c = _transform_norm(HT)
+        c, n = self._c, n/r**2
+        self._r, self._n = r, n
+        s = s.to_global_data()
+        w = c**2*s*n/(n + c*s)
+        # Batches are transformed with numpy, which fixes the sign convention
+        # of the Hartley transform. This does not matter if w(k) = w(-k).
+        axes = tuple(range(w.ndim))
+        w_neg = np.roll(np.flip(w, axes), 1, axes)
+        self._batch_fct = None
+        if np.allclose(w, w_neg):
+            self._batch_fct = np.sqrt(c/w.size)/c
+        return ift.from_global_data(HT.domain, w)
+
+    @property
+    def fast(self):
+        '''Whether mean and samples are computed by the spectral solve.'''
+        return self._w is not None
+
+    def j(self, data):
+        return (self._R.adjoint @ self._N.inverse)(data)
+
+    def mean(self, data):
+        j = self.j(data)
+        if not self.fast:
+            return self._D(j)
+        HT = self._HT
+        return HT(self._w*HT.adjoint(j))*(1./self._c**2)
+
+    def variance(self):
+        '''Diagonal of D, the posterior variance.
+
+        On the spectral path with `w(k) = w(-k)`, D is stationary and its
+        diagonal is the constant `sum(w)/(c*size)`. Otherwise it is not
+        available in closed form and ValueError is raised; estimate it from
+        `draw_samples` instead.
+        '''
+        if not self.fast:
+            raise ValueError(
+                'the variance is only available for the spectral solve; '
+                'estimate it from draw_samples')
+        if self._batch_fct is None:
+            raise ValueError(
+                'the variance needs a symmetric spectrum, w(k) = w(-k); '
+                'estimate it from draw_samples')
+        w = self._w.to_global_data()
+        return ift.full(self._HT.target, w.sum()/(self._c*w.size))
+
+    def _sample_rhs(self):
+        # R^dagger N^-1/2 xi + S^-1/2 eta, whose covariance is D^-1. With
+        # HT HT^dagger = HT^dagger HT = c 1, S^-1/2 eta = HT S_h^-1/2 eta/c.
+        if _diagonal(self._S_h) is None or not isinstance(
+                self._HT, (ift.HartleyOperator,
+                           ift.HarmonicTransformOperator)):
+            raise ValueError('sampling needs a diagonal S_h and a harmonic '
+                             'transform HT')
+        if not hasattr(self, '_c'):
+            self._c = _transform_norm(self._HT)
+        xi = self._N.draw_sample(from_inverse=True)
+        eta = self._S_h.draw_sample(from_inverse=True)
+        return self._R.adjoint(xi) + self._HT(eta)*(1./self._c)
+
+    def draw_sample(self):
+        '''Draws a zero-mean sample from D.'''
+        if not self.fast:
+            return self._D(self._sample_rhs())
+        eta = ift.from_random('normal', self._HT.domain)
+        return self._HT(ift.sqrt(self._w)*eta)*(1./self._c)
+
+    def draw_samples(self, n_samples):
+        '''Draws `n_samples` zero-mean samples from D at once.
+
+        Returns an array of shape `(n_samples,) + position_space.shape`. On
+        the spectral path all samples are transformed in one vectorised FFT,
+        otherwise the linear systems of all samples are solved together with
+        `block_cg`.
+        '''
+        dom = self._HT.target
+        if self.fast and self._batch_fct is not None:
+            w = np.sqrt(self._w.to_global_data())
+            eta = np.random.normal(size=(n_samples,) + w.shape)
+            axes = tuple(range(1, eta.ndim))
+            tmp = np.fft.fftn(w*eta, axes=axes)
+            return (tmp.real + tmp.imag)*self._batch_fct
+        if self.fast:
+            res = [self.draw_sample() for _ in range(n_samples)]
+        else:
+            rhs = [self._sample_rhs() for _ in range(n_samples)]
+            res = block_cg(self._D_inv, rhs, self._tol,
+                           self._iteration_limit)
+        return np.stack([r.to_global_data() for r in res]).reshape(
+            (n_samples,) + dom.shape)
+
+
+def block_cg(op, rhs, tol=1e-7, iteration_limit=100):
+    '''Solves `op(x_i) = rhs_i` for several right-hand sides with the block
+    conjugate gradient method of O'Leary (1980).
+
+    All systems share one Krylov space, which typically needs considerably
+    fewer iterations, and thus applications of `op`, than solving them one by
+    one. The iteration stops once the norm of every residual is below `tol`,
+    or after `iteration_limit` iterations.
+    '''
+    k = len(rhs)
+    x = [0*b for b in rhs]
+    r = list(rhs)
+    p = list(r)
+    rr = np.array([[a.vdot(b) for b in r] for a in r])
+    for _ in range(iteration_limit):
+        if np.all(np.sqrt(np.abs(np.diag(rr))) < tol):
+            break
+        q = [op(pi) for pi in p]
+        pq = np.array([[a.vdot(b) for b in q] for a in p])
+        alpha = np.linalg.lstsq(pq, rr, rcond=None)[0]
+        for j in range(k):
+            for i in range(k):
+                x[j] = x[j] + p[i]*alpha[i, j]
+                r[j] = r[j] - q[i]*alpha[i, j]
+        rr_new = np.array([[a.vdot(b) for b in r] for a in r])
+        beta = np.linalg.lstsq(rr, rr_new, rcond=None)[0]
+        p = [sum((p[i]*beta[i, j] for i in range(k)), r[j]) for j in range(k)]
+        rr = rr_new
+    return x
@@ -18,7 +18,11 @@
 import numpy as np
 
 import nifty5 as ift
-from helpers import plot_WF, power_plot, generate_mysterious_data
+from helpers import (AdaptiveKLSchedule, KLCheckpoint,
+                     ParallelMetricGaussianKL, SampleWorkers,
+                     SamplingHamiltonian, TelemetryStream,
+                     cached_power_space, plot_WF, power_plot,
+                     generate_mysterious_data)
 
 np.random.seed(42)
 
@@ -27,7 +31,7 @@ harmonic_space = position_space.get_default_codomain()
 
 HT = ift.HarmonicTransformOperator(harmonic_space, target=position_space)
 
-power_space = ift.PowerSpace(harmonic_space)
+power_space = cached_power_space(harmonic_space)
 
 # Set up an amplitude operator for the field
 # We want to set up a model for the amplitude spectrum with some magic numbers
@@ -66,29 +70,45 @@ likelihood = ift.GaussianEnergy(mean=data,
 
 
 #### SOLVING PROBLEM ####
-ic_sampling = ift.GradientNormController(iteration_limit=100)
-ic_newton = ift.GradInfNormController(
-    name='Newton', tol=1e-6, iteration_limit=30)
+sampling_settings = {'iteration_limit': 100}
+newton_settings = {'name': 'Newton', 'tol': 1e-6, 'iteration_limit': 30}
+n_iterations, n_samples = 10, (2, 10)
+telemetry = TelemetryStream.from_environment('teaser')
+ic_sampling = ift.GradientNormController(**sampling_settings)
+ic_newton = telemetry.watch(ift.GradInfNormController(**newton_settings))
 minimizer = ift.NewtonCG(ic_newton)
 
-H = ift.StandardHamiltonian(likelihood, ic_sampling)
+H = SamplingHamiltonian(likelihood, ic_sampling)
+workers = SampleWorkers(H, seed=42)
+telemetry.count_workers(workers)
 
 initial_mean = ift.MultiField.full(H.domain, 0.)
-mean = initial_mean
 
-# number of samples used to estimate the KL
-N_samples = 10
-
-# Draw new samples to approximate the KL ten times
-for i in range(10):
+# number of samples used to estimate the KL, raised from 2 up to 10 when
+# the KL estimate becomes too noisy
+schedule = AdaptiveKLSchedule(n_iterations, n_samples)
+# an interrupted run is continued, a changed setting starts over
+checkpoint = KLCheckpoint(
+    'teaser', workers, schedule=schedule,
+    config=(position_space, dct, 0.1, 42, sampling_settings,
+            newton_settings, n_iterations, n_samples))
+mean, first = checkpoint.resume(initial_mean, n_iterations)
+
+# Draw new samples to approximate the KL up to ten times
+for i in schedule.iterations(first):
     # Draw new samples and minimize KL
-    KL = ift.MetricGaussianKL(mean, H, N_samples)
-    KL, convergence = minimizer(KL)
-    mean = KL.position
+    KL = ParallelMetricGaussianKL(mean, workers, schedule.n_samples)
+    telemetry.outer = i
+    KL_new, convergence = minimizer(KL)
+    schedule.update(KL, KL_new)
+    mean = KL_new.position
+    checkpoint.save(i + 1, mean)
+checkpoint.clear()
+print(schedule.report())
 
 # Draw posterior samples and plotting
 N_posterior_samples = 10
-KL = ift.MetricGaussianKL(mean, H, N_posterior_samples)
+KL = ParallelMetricGaussianKL(mean, workers, N_posterior_samples)
 
 # Plotting the reconstruction result
 ground_truth = ift.from_global_data(position_space, ground_truth)
@@ -106,4 +126,4 @@ power_mean = 0.*posterior_power_samples[0]
 for p in posterior_power_samples:
     power_mean = power_mean + p/len(posterior_power_samples)
 power_plot('power_reconstruction', ground_truth_spectrum, power_mean, posterior_power_samples)
-
+workers.close()